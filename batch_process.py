@@ -11,10 +11,12 @@ Usage:
 
 import argparse
 import os
+import re
 import sys
 import time
 import subprocess
 from pathlib import Path
+from typing import Tuple
 
 import pdfplumber
 
@@ -24,20 +26,26 @@ from database import get_all_schools
 from config import PDF_DIR
 
 
-def get_pdf_info(pdf_path: Path) -> dict:
-    """Get PDF info and estimate question/answer page ranges."""
-    with pdfplumber.open(pdf_path) as pdf:
-        total_pages = len(pdf.pages)
-
-    # Parse filename for year and school
+def parse_pdf_name(pdf_path: Path) -> Tuple[str, int]:
+    """Get (school, year) from a PDF filename without opening the file."""
     name = pdf_path.stem
-    import re
     year_match = re.search(r"(\d{4})", name)
     year = int(year_match.group(1)) if year_match else 2025
 
     # Extract school name (last part after last hyphen)
     parts = name.split("-")
     school = parts[-1].strip() if len(parts) >= 4 else "Unknown"
+    return school, year
+
+
+def get_pdf_info(pdf_path: Path) -> dict:
+    """Get PDF info and estimate question/answer page ranges."""
+    with pdfplumber.open(pdf_path) as pdf:
+        total_pages = len(pdf.pages)
+
+    # Parse filename for year and school
+    name = pdf_path.stem
+    school, year = parse_pdf_name(pdf_path)
 
     # Estimate answer key pages (usually last 4-8 pages)
     # Heuristic: ~15% of pages are answer keys
@@ -132,19 +140,19 @@ def main():
         pdfs = [p for p in pdfs if str(args.year) in p.name]
 
     # Get already processed schools
-    processed_schools = get_all_schools() if args.skip_processed else []
+    processed_schools = set(get_all_schools()) if args.skip_processed else set()
 
     # Build processing queue
     queue = []
     for pdf_path in pdfs:
-        info = get_pdf_info(pdf_path)
-
-        # Check if already processed
-        if args.skip_processed and info["school"] in processed_schools:
-            print(f"[SKIP] {info['school']} {info['year']} - already processed")
+        # Check if already processed (from the filename alone, so skipped
+        # PDFs are never opened)
+        school, year = parse_pdf_name(pdf_path)
+        if school in processed_schools:
+            print(f"[SKIP] {school} {year} - already processed")
             continue
 
-        queue.append(info)
+        queue.append(get_pdf_info(pdf_path))
 
     if not queue:
         print("No PDFs to process!")
@@ -10,6 +10,7 @@ PDF_DIR = PROJECT_ROOT / "pdfs"
 OUTPUT_DIR = PROJECT_ROOT / "output"
 IMAGES_DIR = OUTPUT_DIR / "images"
 DATABASE_PATH = OUTPUT_DIR / "p6_questions.db"
+GEMINI_CACHE_DIR = OUTPUT_DIR / "gemini_cache"  # Cached Gemini responses (extraction scripts)
 
 # Ensure output directories exist
 OUTPUT_DIR.mkdir(exist_ok=True)
@@ -123,10 +124,18 @@ ANSWER_TYPE_PATTERNS = {
 
 # OpenCV segmentation parameters
 SEGMENTATION = {
-    "canny_low": 50,
-    "canny_high": 150,
+    # Canny thresholds for a 5x5 Sobel aperture, whose gradients on a step
+    # edge are 12x those of the default 3x3 (where these were 50 and 150)
+    "canny_low": 600,
+    "canny_high": 1800,
     "morph_kernel_width": 100,
     "morph_kernel_height": 1,
+    # Page width is divided by this before line detection. Only x shrinks,
+    # so thin lines keep their darkness and y positions stay exact.
+    "line_detect_x_scale": 4,
+    # "morphology" (opening + connected components) or "integral" (rows
+    # holding one unbroken run of min_line_length, from an integral image)
+    "line_detect_method": "morphology",
     "min_line_length": 200,
     "line_gap_threshold": 20,
     "min_question_height": 50,
@@ -5,7 +5,7 @@ SQLite database schema and operations for P6 Math Question Bank.
 import sqlite3
 import json
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from contextlib import contextmanager
 
 from config import DATABASE_PATH
@@ -73,6 +73,56 @@ def init_db():
     print(f"Database initialized at {DATABASE_PATH}")
 
 
+INSERT_QUESTION_SQL = """
+INSERT OR REPLACE INTO questions (
+    school, year, paper_section, question_num, part_letter, pdf_question_num, pdf_page_num,
+    marks, latex_text, main_context, diagram_description, image_path, options,
+    answer, worked_solution, question_diagram, topic_tags
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _question_row(
+    school: str,
+    year: int,
+    paper_section: str,
+    question_num: int,
+    marks: int,
+    latex_text: str,
+    image_path: str,
+    diagram_description: Optional[str] = None,
+    options: Optional[Dict[str, str]] = None,
+    answer: Optional[str] = None,
+    worked_solution: Optional[str] = None,
+    question_diagram: Optional[str] = None,
+    topic_tags: Optional[List[str]] = None,
+    pdf_question_num: Optional[int] = None,
+    pdf_page_num: Optional[int] = None,
+    part_letter: Optional[str] = None,
+    main_context: Optional[str] = None,
+) -> tuple:
+    """Parameters for INSERT_QUESTION_SQL (see insert_question)."""
+    return (
+        school,
+        year,
+        paper_section,
+        question_num,
+        part_letter or '',  # Use empty string instead of None
+        pdf_question_num if pdf_question_num is not None else question_num,
+        pdf_page_num,
+        marks,
+        latex_text,
+        main_context,
+        diagram_description,
+        str(image_path),
+        json.dumps(options) if options else None,
+        answer,
+        worked_solution,
+        question_diagram,
+        json.dumps(topic_tags) if topic_tags else None,
+    )
+
+
 def insert_question(
     school: str,
     year: int,
@@ -102,36 +152,61 @@ def insert_question(
     """
     with get_connection() as conn:
         cursor = conn.execute(
-            """
-            INSERT OR REPLACE INTO questions (
-                school, year, paper_section, question_num, part_letter, pdf_question_num, pdf_page_num,
-                marks, latex_text, main_context, diagram_description, image_path, options,
-                answer, worked_solution, question_diagram, topic_tags
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                school,
-                year,
-                paper_section,
-                question_num,
-                part_letter or '',  # Use empty string instead of None
-                pdf_question_num if pdf_question_num is not None else question_num,
-                pdf_page_num,
-                marks,
-                latex_text,
-                main_context,
-                diagram_description,
-                str(image_path),
-                json.dumps(options) if options else None,
-                answer,
-                worked_solution,
-                question_diagram,
-                json.dumps(topic_tags) if topic_tags else None,
+            INSERT_QUESTION_SQL,
+            _question_row(
+                school, year, paper_section, question_num, marks, latex_text, image_path,
+                diagram_description, options, answer, worked_solution, question_diagram,
+                topic_tags, pdf_question_num, pdf_page_num, part_letter, main_context,
             ),
         )
         return cursor.lastrowid
 
 
+def insert_questions(questions: List[Dict[str, Any]]) -> int:
+    """Insert many questions in a single transaction.
+
+    Each dict takes insert_question's keyword arguments. Committing once
+    for the whole batch instead of once per row saves a disk sync per
+    question. If any row fails, none are inserted.
+
+    Returns:
+        Number of questions inserted
+    """
+    rows = [_question_row(**q) for q in questions]
+    with get_connection() as conn:
+        conn.executemany(INSERT_QUESTION_SQL, rows)
+    return len(rows)
+
+
+def insert_questions_with_fallback(
+    questions: List[Dict[str, Any]]
+) -> List[Optional[Exception]]:
+    """Insert questions in one transaction, or one at a time if that fails.
+
+    A bad row rolls back the whole batch, so on failure each question is
+    retried with insert_question; the good rows are kept and each bad one
+    gets its own error.
+
+    Returns:
+        One entry per question, in order: None if it was saved, otherwise
+        the exception that stopped it
+    """
+    try:
+        insert_questions(questions)
+        return [None] * len(questions)
+    except Exception as e:
+        print(f"  [WARN] Batch insert failed ({e}), saving one at a time")
+
+    errors = []
+    for q in questions:
+        try:
+            insert_question(**q)
+            errors.append(None)
+        except Exception as e:
+            errors.append(e)
+    return errors
+
+
 def get_question(
     school: str, year: int, paper_section: str, question_num: int,
     part_letter: Optional[str] = None
@@ -328,6 +403,27 @@ def update_answer(
         return cursor.rowcount > 0
 
 
+def update_answers(updates: List[Tuple[int, str, Optional[str]]]) -> int:
+    """Overwrite the answers of many questions in a single transaction.
+
+    Each update is (question_id, answer, worked_solution). As with
+    update_answer(..., overwrite=True), question_diagram is cleared.
+
+    Returns:
+        Number of questions updated
+    """
+    with get_connection() as conn:
+        cursor = conn.executemany(
+            """
+            UPDATE questions
+            SET answer = ?, worked_solution = ?, question_diagram = NULL
+            WHERE id = ?
+            """,
+            [(answer, worked_solution, question_id) for question_id, answer, worked_solution in updates],
+        )
+        return cursor.rowcount
+
+
 def update_question_text(
     question_id: int,
     latex_text: str,
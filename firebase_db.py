@@ -7,9 +7,8 @@ Replaces SQLite with Firebase Firestore for data and Firebase Storage for images
 import os
 import json
 import time
-import base64
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator, Tuple
 from datetime import datetime
 
 import firebase_admin
@@ -20,6 +19,9 @@ _firebase_app = None
 _db = None
 _bucket = None
 
+# Attempts per document before a BulkWriter write is reported as failed
+BULK_WRITE_ATTEMPTS = 3
+
 
 def _get_credentials():
     """Get Firebase credentials from file or Streamlit secrets."""
@@ -280,6 +282,17 @@ def get_questions(
     return questions
 
 
+def iter_questions() -> Iterator[Dict[str, Any]]:
+    """Stream every question, one document at a time.
+
+    Unlike get_questions, results are neither filtered nor sorted, and the
+    collection is never held in memory all at once.
+    """
+    db = get_db()
+    for doc in db.collection('questions').stream():
+        yield _doc_to_question(doc)
+
+
 def get_all_schools() -> List[str]:
     """Get list of all schools in database."""
     db = get_db()
@@ -427,6 +440,69 @@ def update_topic_tags(
     db = get_db()
     doc_ref = db.collection('questions').document(question_id)
 
+    try:
+        doc_ref.update(_topic_tags_data(topics, heuristics, confidence, needs_review))
+        return True
+    except Exception:
+        return False
+
+
+def update_topic_tags_bulk(updates: List[Tuple[str, Dict[str, Any]]]) -> List[str]:
+    """Apply many update_topic_tags calls with one BulkWriter.
+
+    Each update is (question_id, kwargs), where kwargs are the keyword
+    arguments update_topic_tags takes. The writes are sent in parallel
+    batches and, unlike a WriteBatch, succeed or fail per document; a
+    failed write is retried up to BULK_WRITE_ATTEMPTS times in total.
+
+    Returns:
+        IDs of the questions whose update failed
+    """
+    db = get_db()
+    failed = []
+
+    def on_error(failure, _writer) -> bool:
+        if failure.attempts < BULK_WRITE_ATTEMPTS:
+            return True
+        failed.append(failure.operation.reference.id)
+        return False
+
+    writer = db.bulk_writer()
+    writer.on_write_error(on_error)
+    for question_id, tags in updates:
+        doc_ref = db.collection('questions').document(question_id)
+        writer.update(doc_ref, _topic_tags_data(**tags))
+    writer.close()
+    return failed
+
+
+def update_heuristics_batch(updates: List[Tuple[str, List[str]]]) -> bool:
+    """Set the heuristics of many questions in one batched write.
+
+    Each update is (question_id, heuristics) and is applied as
+    update_topic_tags(question_id, heuristics=heuristics) would. A batch
+    holds at most 500 writes, and either all of them apply or none do.
+    """
+    db = get_db()
+    batch = db.batch()
+    for question_id, heuristics in updates:
+        doc_ref = db.collection('questions').document(question_id)
+        batch.update(doc_ref, _topic_tags_data(heuristics=heuristics))
+
+    try:
+        batch.commit()
+        return True
+    except Exception:
+        return False
+
+
+def _topic_tags_data(
+    topics: Optional[List[str]] = None,
+    heuristics: Optional[List[str]] = None,
+    confidence: Optional[float] = None,
+    needs_review: bool = False,
+) -> Dict[str, Any]:
+    """Firestore update fields for update_topic_tags."""
     update_data = {'updated_at': firestore.SERVER_TIMESTAMP}
     if topics is not None:
         update_data['topics'] = json.dumps(topics)
@@ -435,12 +511,7 @@ def update_topic_tags(
     if confidence is not None:
         update_data['confidence'] = confidence
     update_data['needs_review'] = needs_review
-
-    try:
-        doc_ref.update(update_data)
-        return True
-    except Exception:
-        return False
+    return update_data
 
 
 def update_question_metadata(
@@ -528,18 +599,15 @@ def upload_image_bytes(image_bytes, storage_path: str, content_type: str = 'imag
     bucket = get_bucket()
     blob = bucket.blob(storage_path)
 
-    # Convert to bytes if needed
-    if hasattr(image_bytes, 'tobytes'):
-        # memoryview
-        image_bytes = image_bytes.tobytes()
-    elif hasattr(image_bytes, 'read'):
-        # file-like object (BytesIO)
-        image_bytes = image_bytes.read()
-    elif not isinstance(image_bytes, bytes):
-        # Try direct conversion as last resort
-        image_bytes = bytes(image_bytes)
-
-    blob.upload_from_string(image_bytes, content_type=content_type)
+    if hasattr(image_bytes, 'read'):
+        # file-like object (BytesIO): stream it from the start rather than
+        # copying its contents into a new bytes object first
+        blob.upload_from_file(image_bytes, rewind=True, content_type=content_type)
+    else:
+        # memoryview/bytearray need one conversion; bytes pass straight through
+        if not isinstance(image_bytes, bytes):
+            image_bytes = bytes(image_bytes)
+        blob.upload_from_string(image_bytes, content_type=content_type)
     blob.make_public()
     # Append cache-busting timestamp so browsers re-fetch when images are replaced
     return f"{blob.public_url}?t={int(time.time())}"
@@ -13,6 +13,7 @@ Usage:
     python gemini_pipeline.py                    # Process all PDFs
     python gemini_pipeline.py --pdf "file.pdf"   # Process single PDF
     python gemini_pipeline.py --pages 2-10       # Specific page range
+    python gemini_pipeline.py --no-cache         # Bypass cached Gemini responses
 """
 
 import gc
@@ -21,24 +22,79 @@ import re
 import sys
 import json
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass
 
 import pdfplumber
 from PIL import Image
-import psutil
 
 # Add project root to path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from utils.gemini_client import GeminiClient, MCQ_EXTRACTION_PROMPT, ANSWER_EXTRACTION_PROMPT, MULTI_PART_EXTRACTION_PROMPT
-from database import init_db, insert_question, get_statistics
-from config import PDF_DIR, IMAGES_DIR
+from utils.prefetch import prefetch
+from utils.memory import get_memory
+from database import init_db, insert_questions_with_fallback, get_statistics
+from config import PDF_DIR, IMAGES_DIR, GEMINI_CACHE_DIR
 
 # Settings
 DPI = 200  # Higher quality for better extraction
 SAVE_IMAGES = True  # Save page images for reference
+PREFETCH_PAGES = 2  # Pages rendered ahead of the Gemini stage
+
+# Section detection patterns (see detect_section_type). Case-insensitive
+# checks are written in lowercase and run on the page text lowered once,
+# which is several times faster than re.IGNORECASE on the original text.
+STRONG_ANSWER_MARKERS = (
+    "answer key", "marking scheme", "suggested answers",
+    "model answer", "mark scheme",
+)
+BLANK_ANSWER_LINE_RE = re.compile(r'ans\s*:\s*\(?[a-z]?\)?\s*_+')
+QUESTION_NUMBER_RE = re.compile(r'^\s*(\d+)\s*[\.\)]\s*\w', re.MULTILINE)
+MCQ_ANSWER_RUN_RE = re.compile(r'q\s*1[:\s]+[abcd]\s+q\s*2[:\s]+[abcd]')
+ANSWER_PATTERN_RE = re.compile(r'q\s*\d+\s*[:\s]+(?:[abcd]|\$?\d)')
+EQUATION_RE = re.compile(r'\d+\s*[+\-×÷x]\s*\d+\s*=\s*\d+')
+QNUM_WITH_PART_RE = re.compile(r'q\s*\d+\s*\([a-z]\)')
+Q1_TO_10_RE = re.compile(r'\b(q|question)\s*([1-9]|10)\b')
+MCQ_OPTION_RE = re.compile(r'\([A-D]\)|^[A-D]\s*[:\.]', re.MULTILINE)
+
+# Text cleanup patterns (see clean_extracted_text)
+NONE_SUBPART_RE = re.compile(r'\n?\s*\([a-z]\)\s*:?\s*None\s*', re.IGNORECASE)
+NONE_LINE_RE = re.compile(r'^\s*None\s*$', re.MULTILINE | re.IGNORECASE)
+PERIOD_CAPITAL_RE = re.compile(r'\.([A-Z])')
+LOWER_UPPER_RE = re.compile(r'([a-z])([A-Z])')
+MONEY_WORD_RE = re.compile(r'(\$\d+\.?\d*)([a-zA-Z])')
+SYMBOL_WORD_RE = re.compile(r'(\d+[¢%])([a-zA-Z])')
+DIGIT_WORD_RE = re.compile(r'(\d)([a-zA-Z]{2,})')
+LATER_SUBPART_RE = re.compile(r'\([b-z]\)', re.IGNORECASE)
+LEADING_PART_A_RE = re.compile(r'^\s*\(a\)\s*', re.IGNORECASE)
+SPACES_RE = re.compile(r'[ \t]+')
+EXTRA_NEWLINES_RE = re.compile(r'\n{3,}')
+
+# Gemini response parsing patterns (see parse_gemini_response).
+# The field patterns run on blocks already split on BLOCK_SPLIT_RE, which
+# contain no "\n---", so a field that runs to the end of the block is a
+# greedy match rather than a lazy one testing a lookahead at every character.
+BLOCK_SPLIT_RE = re.compile(r"(?:^|\n)---+\s*\n?")
+QUESTION_NUM_RE = re.compile(r"(?:QUESTION|Q)\s*(\d+)", re.IGNORECASE)
+DIAGRAM_RE = re.compile(r"Diagram:\s*(.+)", re.DOTALL | re.IGNORECASE)
+MAIN_RE = re.compile(r"Main:\s*(.+?)(?=\n\([a-z]\):|Diagram:|$)", re.DOTALL | re.IGNORECASE)
+PART_MARKER_RE = re.compile(r"\([a-z]\):", re.IGNORECASE)
+PART_RES = {
+    letter: re.compile(rf"\({letter}\):\s*(.+?)(?=\n\([a-z]\):|\nDiagram:|$)", re.DOTALL | re.IGNORECASE)
+    for letter in "abcde"
+}
+MARKS_RE = re.compile(r'\((\d+)\s*marks?\)', re.IGNORECASE)
+MARKS_STRIP_RE = re.compile(r'\s*\(\d+\s*marks?\)', re.IGNORECASE)
+PART_TEXT_RE = re.compile(r"Text:\s*(.+?)(?=\nDiagram:|$)", re.DOTALL | re.IGNORECASE)
+MCQ_TEXT_RE = re.compile(r"Text:\s*(.+?)(?=\n(?:Type|Options|Diagram|A:)|$)", re.DOTALL | re.IGNORECASE)
+TYPE_RE = re.compile(r"Type:\s*(\w+)", re.IGNORECASE)
+# Zero-width, so one finditer pass reports every line that starts an option
+# (even one inside another option's match), in order of position
+OPTION_RE = re.compile(r"^(?=([A-D]):\s*(.+?)(?=\n[A-D]:|Diagram:|$))", re.DOTALL | re.MULTILINE)
 
 
 @dataclass
@@ -54,12 +110,6 @@ class ParsedQuestion:
     main_context: Optional[str] = None   # Shared problem context for multi-part questions
 
 
-def get_memory():
-    """Get current memory usage."""
-    mem = psutil.virtual_memory()
-    return f"{mem.percent:.1f}%"
-
-
 def parse_school_from_filename(filename: str) -> Tuple[str, int]:
     """Extract school name and year from PDF filename."""
     # Pattern: 2025-P6-Maths-Prelim Exam-St Nicholas.pdf
@@ -79,48 +129,51 @@ def parse_school_from_filename(filename: str) -> Tuple[str, int]:
     return school, year
 
 
+def _has_matches(pattern: re.Pattern, text: str, count: int) -> bool:
+    """True if pattern matches at least count times (stops scanning there)."""
+    return sum(1 for _ in islice(pattern.finditer(text), count)) >= count
+
+
+def _section_by_position(ratio: float) -> str:
+    """Question section implied by how far through the PDF a page is."""
+    if ratio < 0.25:
+        return "mcq"
+    elif ratio < 0.50:
+        return "short_answer"
+    else:
+        return "long_answer"
+
+
 def detect_section_type(page_num: int, total_pages: int, text_hint: str = "") -> str:
     """Detect section type from page content with strong marker priority."""
     text_lower = text_hint.lower()
-
-    # Check if this looks like a question page (has blank answer lines)
-    # Question pages have "Ans: _____" or "Ans: (a) _____" patterns
-    has_blank_answer_lines = bool(re.search(r'ans\s*:\s*\(?[a-z]?\)?\s*_+', text_lower))
-
-    # Check for question number patterns typical of question pages
-    has_question_numbers = bool(re.search(r'^\s*(\d+)\s*[\.\)]\s*\w', text_hint, re.MULTILINE))
+    ratio = page_num / total_pages
 
     # PRIORITY 1: Strong answer key markers (explicit headers)
-    strong_answer_markers = [
-        "answer key", "marking scheme", "suggested answers",
-        "model answer", "mark scheme"
-    ]
-    if any(marker in text_lower for marker in strong_answer_markers):
+    if any(marker in text_lower for marker in STRONG_ANSWER_MARKERS):
         return "answer_key"
 
     # Check for dense MCQ answer patterns (Q1: A, Q2: B style) - definite answer key
-    if re.search(r'Q\s*1[:\s]+[ABCD]\s+Q\s*2[:\s]+[ABCD]', text_hint, re.IGNORECASE):
+    if MCQ_ANSWER_RUN_RE.search(text_lower):
         return "answer_key"
 
     # Check for tabular answer format: multiple "Q#: answer" patterns in quick succession
-    answer_pattern_count = len(re.findall(r'Q\s*\d+\s*[:\s]+(?:[ABCD]|\$?\d)', text_hint, re.IGNORECASE))
-    if answer_pattern_count >= 5:  # Likely an answer key page
+    if _has_matches(ANSWER_PATTERN_RE, text_lower, 5):  # Likely an answer key page
         return "answer_key"
 
     # Check for dense working/solution patterns (multiple equations on one page = answer key)
     # Answer key pages typically have many calculations like "= 45", "÷ 3 = 15", etc.
-    equation_count = len(re.findall(r'\d+\s*[+\-×÷x]\s*\d+\s*=\s*\d+', text_hint))
-    if equation_count >= 6:  # Many calculations = likely answer key
+    if _has_matches(EQUATION_RE, text_hint, 6):  # Many calculations = likely answer key
         return "answer_key"
 
     # Check for multiple Q# patterns with sub-parts and answers (answer key format)
     # Pattern like "Q7 (b) 229°" or "Q13 (a) 60 - 48 = 12"
-    qnum_with_parts = len(re.findall(r'Q\s*\d+\s*\([a-z]\)', text_hint, re.IGNORECASE))
-    if qnum_with_parts >= 4:  # Multiple Q# (a)/(b) patterns = answer key
+    if _has_matches(QNUM_WITH_PART_RE, text_lower, 4):  # Multiple Q# (a)/(b) patterns = answer key
         return "answer_key"
 
     # If page has blank answer lines, it's a question page, not answer key
-    if has_blank_answer_lines:
+    # Question pages have "Ans: _____" or "Ans: (a) _____" patterns
+    if BLANK_ANSWER_LINE_RE.search(text_lower):
         # Determine question type based on section markers first
         if "paper 2" in text_lower:
             return "long_answer"
@@ -129,13 +182,7 @@ def detect_section_type(page_num: int, total_pages: int, text_hint: str = "") ->
         if "booklet a" in text_lower:
             return "mcq"
         # Fall back to position-based
-        ratio = page_num / total_pages
-        if ratio < 0.25:
-            return "mcq"
-        elif ratio < 0.50:
-            return "short_answer"
-        else:
-            return "long_answer"
+        return _section_by_position(ratio)
 
     # PRIORITY 2: Strong section markers from page headers
     if "booklet a" in text_lower or "questions 1 to 10" in text_lower:
@@ -146,33 +193,27 @@ def detect_section_type(page_num: int, total_pages: int, text_hint: str = "") ->
         return "long_answer"
 
     # PRIORITY 3: Detect by question number ranges mentioned
-    q1_10_pattern = re.search(r'\b(Q|Question)\s*([1-9]|10)\b', text_hint, re.IGNORECASE)
-    mcq_options = re.findall(r'\([A-D]\)|^[A-D]\s*[:\.]', text_hint, re.MULTILINE)
-
-    if q1_10_pattern and len(mcq_options) >= 4:
+    if Q1_TO_10_RE.search(text_lower) and _has_matches(MCQ_OPTION_RE, text_hint, 4):
         return "mcq"
 
+    # Check for question number patterns typical of question pages
+    # (only the fallbacks below need this, so it is not computed earlier)
+    has_question_numbers = bool(QUESTION_NUMBER_RE.search(text_hint))
+
     # PRIORITY 4: Content-based detection for P2 pages
     # If page has question numbers and long text content, likely a question page
     if has_question_numbers and len(text_hint) > 500:
-        ratio = page_num / total_pages
         if ratio >= 0.50:  # Later half of PDF
             return "long_answer"
 
     # PRIORITY 5: Position-based heuristic (last resort only)
     # Be very conservative - only classify as answer_key if we're very sure
-    ratio = page_num / total_pages
     if ratio >= 0.90:  # Only last 10% as answer key (more conservative)
         # Double-check: if page has significant text content, might be question page
         if len(text_hint) > 800 and has_question_numbers:
             return "long_answer"
         return "answer_key"
-    elif ratio < 0.25:
-        return "mcq"
-    elif ratio < 0.50:
-        return "short_answer"
-    else:
-        return "long_answer"
+    return _section_by_position(ratio)
 
 
 def clean_extracted_text(text: str, has_subparts: bool = None) -> str:
@@ -187,42 +228,42 @@ def clean_extracted_text(text: str, has_subparts: bool = None) -> str:
         return text
 
     # Remove "(a) None" or "(a): None" patterns (spurious sub-part markers)
-    text = re.sub(r'\n?\s*\([a-z]\)\s*:?\s*None\s*', '', text, flags=re.IGNORECASE)
+    text = NONE_SUBPART_RE.sub('', text)
 
     # Remove standalone "None" on its own line
-    text = re.sub(r'^\s*None\s*$', '', text, flags=re.MULTILINE | re.IGNORECASE)
+    text = NONE_LINE_RE.sub('', text)
 
     # Fix missing spaces after periods (e.g., "word.Another" -> "word. Another")
-    text = re.sub(r'\.([A-Z])', r'. \1', text)
+    text = PERIOD_CAPITAL_RE.sub(r'. \1', text)
 
     # Fix garbled OCR: missing spaces before capital letters in run-together words
     # e.g., "TheamountofmoneycollectedonMonday" -> "The amount of money collected on Monday"
-    text = re.sub(r'([a-z])([A-Z])', r'\1 \2', text)
+    text = LOWER_UPPER_RE.sub(r'\1 \2', text)
 
     # Fix garbled OCR: missing spaces after currency/numbers
     # e.g., "$3.10morethanapen" -> "$3.10 more than a pen"
-    text = re.sub(r'(\$\d+\.?\d*)([a-zA-Z])', r'\1 \2', text)
+    text = MONEY_WORD_RE.sub(r'\1 \2', text)
 
     # Fix garbled OCR: missing spaces after numbers with symbols before words
     # e.g., "20¢coins" -> "20¢ coins", "25%more" -> "25% more"
-    text = re.sub(r'(\d+[¢%])([a-zA-Z])', r'\1 \2', text)
+    text = SYMBOL_WORD_RE.sub(r'\1 \2', text)
 
     # Fix missing space after numbers before words
     # e.g., "1coinsthan" -> "1 coins than"
-    text = re.sub(r'(\d)([a-zA-Z]{2,})', r'\1 \2', text)
+    text = DIGIT_WORD_RE.sub(r'\1 \2', text)
 
     # Auto-detect if this is a multi-part question
     if has_subparts is None:
         # Check if text has (b), (c), etc. - indicates genuine multi-part question
-        has_subparts = bool(re.search(r'\([b-z]\)', text, re.IGNORECASE))
+        has_subparts = bool(LATER_SUBPART_RE.search(text))
 
     # Remove spurious standalone "(a)" at start of text when not multi-part
     if not has_subparts:
-        text = re.sub(r'^\s*\(a\)\s*', '', text, flags=re.IGNORECASE)
+        text = LEADING_PART_A_RE.sub('', text)
 
     # Remove excessive whitespace but preserve paragraph breaks
-    text = re.sub(r'[ \t]+', ' ', text)  # Multiple spaces to single space
-    text = re.sub(r'\n{3,}', '\n\n', text)  # Max 2 newlines
+    text = SPACES_RE.sub(' ', text)  # Multiple spaces to single space
+    text = EXTRA_NEWLINES_RE.sub('\n\n', text)  # Max 2 newlines
 
     # Clean up leading/trailing whitespace on each line
     lines = [line.strip() for line in text.split('\n')]
@@ -241,14 +282,14 @@ def parse_gemini_response(response: str, section_type: str) -> List[ParsedQuesti
     questions = []
 
     # Split by question markers
-    blocks = re.split(r"(?:^|\n)---+\s*\n?", response)
+    blocks = BLOCK_SPLIT_RE.split(response)
 
     for block in blocks:
         if not block.strip():
             continue
 
         # Try to extract question number
-        num_match = re.search(r"(?:QUESTION|Q)\s*(\d+)", block, re.IGNORECASE)
+        num_match = QUESTION_NUM_RE.search(block)
         if not num_match:
             continue
 
@@ -262,15 +303,15 @@ def parse_gemini_response(response: str, section_type: str) -> List[ParsedQuesti
         q_type = section_type
 
         # Extract diagram description (common to all formats)
-        diag_match = re.search(r"Diagram:\s*(.+?)(?=\n---|$)", block, re.DOTALL | re.IGNORECASE)
+        diag_match = DIAGRAM_RE.search(block)
         if diag_match:
             diagram = diag_match.group(1).strip()
             if diagram.lower() in ["none", "n/a", ""]:
                 diagram = None
 
         # Check if this is a multi-part question (has Main: or (a):)
-        has_main = re.search(r"Main:\s*(.+?)(?=\n\([a-z]\):|Diagram:|$)", block, re.DOTALL | re.IGNORECASE)
-        has_parts = re.search(r"\([a-z]\):", block, re.IGNORECASE)
+        has_main = MAIN_RE.search(block)
+        has_parts = PART_MARKER_RE.search(block)
 
         if has_main or has_parts:
             # MULTI-PART QUESTION FORMAT
@@ -285,31 +326,30 @@ def parse_gemini_response(response: str, section_type: str) -> List[ParsedQuesti
                     main_text = ""
 
             # Extract sub-parts (a), (b), (c), etc.
-            for letter in ['a', 'b', 'c', 'd', 'e']:
-                part_pattern = rf"\({letter}\):\s*(.+?)(?=\n\([a-z]\):|\nDiagram:|\n---|$)"
-                part_match = re.search(part_pattern, block, re.DOTALL | re.IGNORECASE)
+            for letter, part_re in PART_RES.items():
+                part_match = part_re.search(block)
                 if part_match:
                     part_text = part_match.group(1).strip()
                     # Skip if part text is just "None" or empty
                     if part_text.lower() in ["none", "n/a", ""]:
                         continue
                     # Extract marks from part if present
-                    mark_match = re.search(r'\((\d+)\s*marks?\)', part_text, re.IGNORECASE)
+                    mark_match = MARKS_RE.search(part_text)
                     part_marks = int(mark_match.group(1)) if mark_match else 2
                     # Clean marks from text
-                    part_text = re.sub(r'\s*\(\d+\s*marks?\)', '', part_text, flags=re.IGNORECASE).strip()
+                    part_text = MARKS_STRIP_RE.sub('', part_text).strip()
                     if part_text:  # Only add non-empty parts
                         parsed_parts.append((letter, part_text, part_marks))
 
             # Also check for Text: field (single question with no parts)
             if not parsed_parts:
-                text_match = re.search(r"Text:\s*(.+?)(?=\nDiagram:|\n---|$)", block, re.DOTALL | re.IGNORECASE)
+                text_match = PART_TEXT_RE.search(block)
                 if text_match:
                     text = text_match.group(1).strip()
                     # Check for marks in text
-                    mark_match = re.search(r'\((\d+)\s*marks?\)', text, re.IGNORECASE)
+                    mark_match = MARKS_RE.search(text)
                     part_marks = int(mark_match.group(1)) if mark_match else 2
-                    text = re.sub(r'\s*\(\d+\s*marks?\)', '', text, flags=re.IGNORECASE).strip()
+                    text = MARKS_STRIP_RE.sub('', text).strip()
                     if main_text:
                         text = main_text + "\n\n" + text
                     # Single question, no parts
@@ -350,20 +390,22 @@ def parse_gemini_response(response: str, section_type: str) -> List[ParsedQuesti
         else:
             # MCQ or simple question format
             # Extract text
-            text_match = re.search(r"Text:\s*(.+?)(?=\n(?:Type|Options|Diagram|A:)|$)", block, re.DOTALL | re.IGNORECASE)
+            text_match = MCQ_TEXT_RE.search(block)
             text = text_match.group(1).strip() if text_match else ""
 
             # Extract type
-            type_match = re.search(r"Type:\s*(\w+)", block, re.IGNORECASE)
+            type_match = TYPE_RE.search(block)
             q_type = type_match.group(1) if type_match else section_type
 
             # Extract options for MCQ
             if "mcq" in q_type.lower() or section_type == "mcq":
-                options = {}
-                for letter in ["A", "B", "C", "D"]:
-                    opt_match = re.search(rf"^{letter}:\s*(.+?)(?=\n[A-D]:|Diagram:|$)", block, re.DOTALL | re.MULTILINE)
-                    if opt_match:
-                        options[letter] = opt_match.group(1).strip()
+                # First occurrence of each letter, from a single scan
+                found = {}
+                for opt_match in OPTION_RE.finditer(block):
+                    found.setdefault(opt_match.group(1), opt_match.group(2))
+                    if len(found) == 4:
+                        break
+                options = {letter: found[letter].strip() for letter in "ABCD" if letter in found}
                 if not options:
                     options = None
 
@@ -421,7 +463,9 @@ def process_pdf(
     }
 
     try:
-        with pdfplumber.open(pdf_path) as pdf:
+        # Page PNGs are written on a background thread so encoding them
+        # overlaps the Gemini call instead of delaying it
+        with pdfplumber.open(pdf_path) as pdf, ThreadPoolExecutor(max_workers=1) as save_pool:
             total_pages = len(pdf.pages)
             print(f"[INFO] Total pages: {total_pages}")
 
@@ -438,25 +482,31 @@ def process_pdf(
             print(f"[INFO] Memory: {get_memory()}")
 
             current_section = "mcq"
+            save_futures = []
 
-            for page_idx in range(start_idx, end_idx):
+            def render_page(page_idx: int) -> Tuple[Image.Image, str]:
+                """Convert page to image and get text hint for section detection."""
+                page = pdf.pages[page_idx]
+                image, text = page.to_image(resolution=DPI).original, page.extract_text() or ""
+                page.close()  # drop pdfplumber's per-page object cache
+                return image, text
+
+            # Upcoming pages render while Gemini processes the current one.
+            # The generator is iterated inline, not bound to a name, so if
+            # the loop raises it is closed (joining the render thread)
+            # before the with block closes the PDF it renders from.
+            for page_idx, (image, text_hint) in prefetch(
+                render_page, range(start_idx, end_idx), depth=PREFETCH_PAGES
+            ):
                 page_num = page_idx + 1
                 print(f"\n[PAGE {page_num}/{total_pages}] ", end="")
 
-                # Convert page to image
-                page = pdf.pages[page_idx]
-                img = page.to_image(resolution=DPI)
-                image = img.original
-
-                # Get text hint for section detection
-                text_hint = page.extract_text() or ""
                 section_type = detect_section_type(page_num, total_pages, text_hint)
 
                 # Skip if likely blank/cover page
                 if len(text_hint) < 50 and page_num <= 2:
                     print(f"[SKIP] Cover/blank page")
                     del image
-                    gc.collect()
                     continue
 
                 print(f"[{section_type.upper()}] ", end="")
@@ -465,13 +515,12 @@ def process_pdf(
                 if section_type == "answer_key":
                     print(f"[SKIP] Answer key page - use parse_answers.py")
                     del image
-                    gc.collect()
                     continue
 
                 # Save image if enabled
                 if SAVE_IMAGES:
                     img_path = IMAGES_DIR / f"{school}_{year}_p{page_num:02d}.png"
-                    image.save(img_path)
+                    save_futures.append(save_pool.submit(image.save, img_path))
 
                 # Send to Gemini with appropriate prompt
                 if section_type == "mcq":
@@ -488,8 +537,9 @@ def process_pdf(
                     questions = parse_gemini_response(result.question_text, section_type)
                     print(f"Found {len(questions)} questions")
 
-                    # Save to database
+                    # Save to database (the page's questions in one transaction)
                     if save_to_db and section_type != "answer_key":
+                        rows = []
                         for q in questions:
                             try:
                                 # Determine paper section code
@@ -517,7 +567,7 @@ def process_pdf(
 
                                 img_path = IMAGES_DIR / f"{school}_{year}_p{page_num:02d}.png"
 
-                                insert_question(
+                                rows.append(dict(
                                     school=school,
                                     year=year,
                                     paper_section=paper_section,
@@ -531,11 +581,16 @@ def process_pdf(
                                     pdf_page_num=page_num,
                                     part_letter=q.part_letter,
                                     main_context=q.main_context,
-                                )
-                                stats["questions_found"] += 1
+                                ))
                             except Exception as e:
                                 stats["errors"].append(f"Q{q.number}: {e}")
 
+                        for row, error in zip(rows, insert_questions_with_fallback(rows)):
+                            if error is None:
+                                stats["questions_found"] += 1
+                            else:
+                                stats["errors"].append(f"Q{row['pdf_question_num']}: {error}")
+
                     elif section_type == "answer_key":
                         # TODO: Parse and link answers to questions
                         print(f"    [Answer key - linking TODO]")
@@ -548,12 +603,19 @@ def process_pdf(
 
                 # Cleanup
                 del image
-                gc.collect()
+
+            for future in save_futures:
+                if future.exception():
+                    stats["errors"].append(f"Image save: {future.exception()}")
 
     except Exception as e:
         print(f"\n[ERROR] {e}")
         stats["errors"].append(str(e))
 
+    # Pages are freed by refcount as the loop goes; one sweep per PDF is
+    # enough for any cycles pdfplumber leaves behind
+    gc.collect()
+
     return stats
 
 
@@ -562,6 +624,8 @@ def main():
     parser.add_argument("--pdf", type=str, help="Specific PDF to process")
     parser.add_argument("--pages", type=str, help="Page range (e.g., 2-10)")
     parser.add_argument("--no-db", action="store_true", help="Don't save to database")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always call Gemini instead of reusing cached responses")
     args = parser.parse_args()
 
     # Check API key
@@ -585,7 +649,10 @@ def main():
 
     # Init Gemini client
     print("[INIT] Connecting to Gemini...")
-    client = GeminiClient(api_key=api_key)
+    client = GeminiClient(
+        api_key=api_key,
+        cache_dir=None if args.no_cache else GEMINI_CACHE_DIR,
+    )
     if not client.test_connection():
         print("[ERROR] Gemini connection failed!")
         sys.exit(1)
@@ -8,9 +8,9 @@ to questions already in the database.
 Usage:
     export GEMINI_API_KEY="your-key"
     python parse_answers.py --pdf "2025-P6-Maths-Prelim Exam-St Nicholas.pdf"
+    python parse_answers.py --pdf "..." --no-cache   # Bypass cached Gemini responses
 """
 
-import gc
 import os
 import re
 import sys
@@ -21,13 +21,14 @@ from dataclasses import dataclass
 
 import pdfplumber
 from PIL import Image
-import psutil
 
 sys.path.insert(0, str(Path(__file__).parent))
 
 from utils.gemini_client import GeminiClient
+from utils.prefetch import prefetch
+from utils.memory import get_memory
 from database import get_questions, get_question, update_answer, get_connection
-from config import PDF_DIR, IMAGES_DIR
+from config import PDF_DIR, IMAGES_DIR, GEMINI_CACHE_DIR
 
 DPI = 200
 
@@ -56,6 +57,19 @@ Answer: 75
 
 Extract EVERY answer visible on this page. Be thorough and precise."""
 
+# Answer key page detection (matched against lowercased page text)
+STRONG_ANSWER_MARKERS = (
+    "answer key", "marking scheme", "suggested answers",
+    "model answer", "mark scheme",
+)
+BLANK_ANSWER_RE = re.compile(r'ans\s*:\s*_+')
+ANSWER_PATTERN_RE = re.compile(r'q\s*\d+\s*[:\s]+(?:[abcd]|\$?\d)')
+Q123_RE = re.compile(r'q[123]')  # same count as text.count("q1") + "q2" + "q3"
+MCQ_SEQUENCE_RE = re.compile(r'\b[abcd]\b.*\b[abcd]\b.*\b[abcd]\b')
+
+# Answer response line parsing
+Q_LINE_RE = re.compile(r'^Q(\d+)\s*[:\-]?\s*(.*)$', re.IGNORECASE)
+
 
 @dataclass
 class ParsedAnswer:
@@ -65,11 +79,6 @@ class ParsedAnswer:
     working: Optional[str] = None
 
 
-def get_memory():
-    mem = psutil.virtual_memory()
-    return f"{mem.percent:.1f}%"
-
-
 def parse_school_from_filename(filename: str) -> Tuple[str, int]:
     """Extract school name and year from PDF filename."""
     name = Path(filename).stem
@@ -129,8 +138,14 @@ def parse_answer_response(response: str, section_hint: str = "") -> List[ParsedA
         if not line:
             continue
 
+        # Dispatch on the first character so the common lines skip the
+        # regex and repeated lowercasing
+        first = line[0]
+
         # Check for question number pattern: Q1:, Q2:, etc.
-        q_match = re.match(r'^Q(\d+)\s*[:\-]?\s*(.*)$', line, re.IGNORECASE)
+        q_match = None
+        if first in 'Qq' and line[1:2].isdecimal():
+            q_match = Q_LINE_RE.match(line)
 
         if q_match:
             # Save previous question if exists
@@ -151,11 +166,11 @@ def parse_answer_response(response: str, section_hint: str = "") -> List[ParsedA
                 current_answer = None
             current_working = []
 
-        elif line.lower().startswith('answer:'):
-            current_answer = line.split(':', 1)[1].strip()
+        elif first in 'Aa' and line[:7].lower() == 'answer:':
+            current_answer = line[7:].strip()
 
-        elif line.lower().startswith('working:'):
-            current_working.append(line.split(':', 1)[1].strip())
+        elif first in 'Ww' and line[:8].lower() == 'working:':
+            current_working.append(line[8:].strip())
 
         elif current_q is not None and not current_answer:
             # Might be a continuation of answer
@@ -209,44 +224,65 @@ def determine_section_for_answer(question_num: int, answer: str, page_text: str
     return None
 
 
-def detect_answer_key_pages(pdf_path: Path) -> List[int]:
-    """Detect which pages are likely answer key pages."""
+def detect_answer_key_pages(
+    pdf_path: Path, page_texts: Optional[Dict[int, str]] = None
+) -> List[int]:
+    """
+    Detect which pages are likely answer key pages.
+
+    Args:
+        pdf_path: Path to the PDF
+        page_texts: Optional dict to fill with each page's extracted text
+                    (keyed by 1-indexed page number) so callers can reuse it
+
+    Returns:
+        List of 1-indexed answer key page numbers
+    """
     answer_pages = []
 
     with pdfplumber.open(pdf_path) as pdf:
+        total = len(pdf.pages)
         for i, page in enumerate(pdf.pages):
-            text = (page.extract_text() or "").lower()
+            raw_text = page.extract_text() or ""
+            page.close()  # drop cached chars/objects; only the text is needed
+            if page_texts is not None:
+                page_texts[i + 1] = raw_text
+
+            # Lowercase once; every check below scans this same string
+            text = raw_text.lower()
 
             # Check for strong answer key indicators (explicit headers)
-            strong_markers = [
-                "answer key", "marking scheme", "suggested answers",
-                "model answer", "mark scheme"
-            ]
-            if any(marker in text for marker in strong_markers):
+            if any(marker in text for marker in STRONG_ANSWER_MARKERS):
                 answer_pages.append(i + 1)
                 continue
 
             # Check for dense Q1, Q2, Q3 patterns (typical of answer sheets)
             # But NOT if page has blank answer lines (which indicates question page)
-            has_blank_answers = bool(re.search(r'ans\s*:\s*_+', text))
-            if has_blank_answers:
+            if BLANK_ANSWER_RE.search(text):
                 continue  # This is a question page, not answer key
 
             # Check for tabular answer format: multiple Q#: answer patterns
-            answer_pattern_count = len(re.findall(r'q\s*\d+\s*[:\s]+(?:[abcd]|\$?\d)', text))
+            # (stop counting as soon as the threshold is reached)
+            answer_pattern_count = 0
+            for _ in ANSWER_PATTERN_RE.finditer(text):
+                answer_pattern_count += 1
+                if answer_pattern_count >= 5:
+                    break
             if answer_pattern_count >= 5:
                 answer_pages.append(i + 1)
                 continue
 
             # Check for dense MCQ answers (A B C D patterns close together)
-            if text.count("q1") + text.count("q2") + text.count("q3") >= 2:
-                mcq_pattern = re.search(r'\b[abcd]\b.*\b[abcd]\b.*\b[abcd]\b', text)
-                if mcq_pattern:
-                    answer_pages.append(i + 1)
+            q_count = 0
+            for _ in Q123_RE.finditer(text):
+                q_count += 1
+                if q_count >= 2:
+                    break
+            if q_count >= 2 and MCQ_SEQUENCE_RE.search(text):
+                answer_pages.append(i + 1)
 
     # If no pages detected, assume last 10% of PDF (conservative)
     if not answer_pages:
-        total = len(pdf.pages)
         start = int(total * 0.9)
         answer_pages = list(range(start + 1, total + 1))
 
@@ -267,22 +303,28 @@ def process_answer_pages(
     with pdfplumber.open(pdf_path) as pdf:
         total_pages = len(pdf.pages)
 
-        # Detect or use provided page numbers
+        # Detect or use provided page numbers (detection extracts every
+        # page's text, which is kept so answer pages are not extracted twice)
+        page_texts: Dict[int, str] = {}
         if page_numbers is None:
-            page_numbers = detect_answer_key_pages(pdf_path)
+            page_numbers = detect_answer_key_pages(pdf_path, page_texts)
 
         print(f"[INFO] Processing answer key pages: {page_numbers}")
 
-        for page_num in page_numbers:
-            if page_num < 1 or page_num > total_pages:
-                continue
+        def render_page(page_num: int) -> Tuple[str, Image.Image]:
+            page = pdf.pages[page_num - 1]
+            text = page_texts.pop(page_num, None)
+            if text is None:
+                text = page.extract_text() or ""
+            image = page.to_image(resolution=DPI).original
+            page.close()
+            return text, image
 
-            print(f"\n[PAGE {page_num}] ", end="")
+        valid_pages = [p for p in page_numbers if 1 <= p <= total_pages]
 
-            page = pdf.pages[page_num - 1]
-            page_text = page.extract_text() or ""
-            img = page.to_image(resolution=DPI)
-            image = img.original
+        # Next page renders while Gemini processes the current one
+        for page_num, (page_text, image) in prefetch(render_page, valid_pages):
+            print(f"\n[PAGE {page_num}] ", end="")
 
             # Send to Gemini
             result = client.extract_from_image(image, ANSWER_KEY_PROMPT, page_num)
@@ -387,7 +429,6 @@ def process_answer_pages(
             stats["pages"] += 1
 
             del image
-            gc.collect()
 
     return stats
 
@@ -396,6 +437,8 @@ def main():
     parser = argparse.ArgumentParser(description="Parse answer keys and link to questions")
     parser.add_argument("--pdf", type=str, required=True, help="PDF file to process")
     parser.add_argument("--pages", type=str, help="Specific pages (e.g., 39-48)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always call Gemini instead of reusing cached responses")
     args = parser.parse_args()
 
     api_key = os.environ.get("GEMINI_API_KEY")
@@ -431,7 +474,10 @@ def main():
 
     # Init Gemini
     print("\n[INIT] Connecting to Gemini...")
-    client = GeminiClient(api_key=api_key)
+    client = GeminiClient(
+        api_key=api_key,
+        cache_dir=None if args.no_cache else GEMINI_CACHE_DIR,
+    )
 
     # Process
     stats = process_answer_pages(pdf_path, client, school, year, page_numbers)
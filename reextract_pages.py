@@ -8,22 +8,32 @@ Usage:
 """
 
 import argparse
+import json
 import os
+import re
 import sys
 import time
-import gc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
+from typing import List, Optional, Tuple
 
-import pdfplumber
+import fitz  # PyMuPDF
 from PIL import Image
 
 sys.path.insert(0, str(Path(__file__).parent))
 
-from utils.gemini_client import GeminiClient
-from database import insert_question, get_connection
+from utils.gemini_client import GeminiClient, ExtractionResult
+from utils.json_extract import parse_first_json_object
+from database import insert_questions_with_fallback, get_connection
 from config import PDF_DIR, IMAGES_DIR
 
 DPI = 200
+BATCH_SIZE = 5  # Pages sent together in one Gemini request
+REQUEST_WORKERS = 4  # Gemini requests in flight at once
+MAX_RETRIES = 3
+RATE_LIMIT_MARKERS = ("429", "quota", "rate limit", "resource_exhausted")
+YEAR_RE = re.compile(r"(\d{4})")
 
 
 # Focused extraction prompt for re-extraction
@@ -69,132 +79,247 @@ IMPORTANT:
 Return ONLY valid JSON.
 """
 
+# Appended to REEXTRACT_PROMPT when several pages share one request
+BATCH_PROMPT_SUFFIX = """
+MULTIPLE PAGES:
+You are given {count} page images, in page order. Extract each page
+separately as described above, then return them wrapped in ONE JSON object:
+{{
+  "pages": [
+    {{"page_index": 0, "questions": [...]}},
+    {{"page_index": 1, "questions": [...]}}
+  ]
+}}
+page_index is the image's position (0 = first image). Include an entry for
+every image, with an empty "questions" list if the page has none.
+"""
 
-def extract_page(client: GeminiClient, pdf_path: Path, page_num: int, school: str, year: int):
-    """Re-extract a single page."""
-    print(f"\n[PAGE {page_num}] Extracting...")
-
-    with pdfplumber.open(pdf_path) as pdf:
-        if page_num < 1 or page_num > len(pdf.pages):
-            print(f"  Invalid page number")
-            return []
 
-        page = pdf.pages[page_num - 1]
-        img = page.to_image(resolution=DPI)
-        image = img.original
+def parse_pdf_name(pdf_path: Path) -> Tuple[str, int]:
+    """Get (school, year) from a PDF filename like 2025-P6-Maths-Prelim Exam-School.pdf."""
+    name = pdf_path.stem
+    year_match = YEAR_RE.search(name)
+    year = int(year_match.group(1)) if year_match else 2025
 
-        # Save image
+    # Extract school name (last part after last hyphen)
+    parts = name.split("-")
+    school = parts[-1].strip() if len(parts) >= 5 else "Unknown"
+    return school, year
+
+
+def render_page(doc: fitz.Document, page_num: int) -> Optional[fitz.Pixmap]:
+    """Render a 1-indexed page of an open PyMuPDF document, or None if out of range."""
+    if page_num < 1 or page_num > doc.page_count:
+        return None
+    return doc.load_page(page_num - 1).get_pixmap(
+        matrix=fitz.Matrix(DPI / 72, DPI / 72), alpha=False
+    )
+
+
+def parse_json_response(response: str) -> Optional[dict]:
+    """Pull the JSON object out of a Gemini response, or None (with a message)."""
+    try:
+        data = parse_first_json_object(response)
+    except json.JSONDecodeError as e:
+        print(f"  [ERROR] JSON parse error: {e}")
+        return None
+
+    if data is None:
+        print(f"  [ERROR] No JSON found in response")
+        print(f"  Response: {response[:200]}...")
+    return data
+
+
+@dataclass
+class ExtractedQuestion:
+    """A re-extracted question (or part), with insert_question's field names."""
+    school: str
+    year: int
+    paper_section: str
+    question_num: int
+    pdf_question_num: int
+    part_letter: Optional[str]
+    marks: int
+    latex_text: str
+    main_context: Optional[str]
+    image_path: str
+    pdf_page_num: int
+
+
+def build_questions(
+    questions: list, school: str, year: int, page_num: int, image_path: Path
+) -> List[ExtractedQuestion]:
+    """Convert one page's extracted questions into database rows."""
+    extracted = []
+    for q in questions:
+        qnum = q.get("question_number", 0)
+        marks = q.get("marks") or 2  # Default to 2 marks if not specified
+        text = q.get("question_text", "")
+        has_parts = q.get("has_parts", False)
+
+        # Determine section based on question number
+        if qnum <= 15:
+            section = "P1A"
+            stored_num = qnum
+        elif qnum <= 30:
+            section = "P1B"
+            stored_num = qnum - 15  # Q16->1, Q17->2, etc.
+        else:
+            section = "P2"
+            stored_num = qnum
+
+        if has_parts and q.get("parts"):
+            for part in q["parts"]:
+                part_letter = part.get("part", "a")
+                part_text = part.get("text", text)
+
+                extracted.append(ExtractedQuestion(
+                    school=school,
+                    year=year,
+                    paper_section=section,
+                    question_num=stored_num,
+                    pdf_question_num=qnum,
+                    part_letter=part_letter,
+                    marks=marks,
+                    latex_text=part_text,
+                    main_context=text,
+                    image_path=str(image_path),
+                    pdf_page_num=page_num,
+                ))
+                print(f"    Q{qnum}({part_letter}): {part_text[:50]}...")
+        else:
+            extracted.append(ExtractedQuestion(
+                school=school,
+                year=year,
+                paper_section=section,
+                question_num=stored_num,
+                pdf_question_num=qnum,
+                part_letter=None,
+                marks=marks,
+                latex_text=text,
+                main_context=None,
+                image_path=str(image_path),
+                pdf_page_num=page_num,
+            ))
+            print(f"    Q{qnum}: {text[:50]}...")
+
+    return extracted
+
+
+def render_request_pages(doc: fitz.Document, page_nums: List[int], school: str, year: int):
+    """Render the pages for one request.
+
+    Returns:
+        (rendered, pixmaps): rendered holds (page_num, image, image_path)
+        tuples with PIL images for GeminiClient; pixmaps holds the matching
+        PyMuPDF pixmaps, not yet written to image_path (see save_rendered_pages)
+    """
+    rendered, pixmaps = [], []
+    for page_num in page_nums:
+        pix = render_page(doc, page_num)
+        if pix is None:
+            print(f"  Page {page_num}: invalid page number")
+            continue
+        # samples_mv is a view of the pixmap buffer; samples would copy it
+        image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples_mv)
         image_path = IMAGES_DIR / f"{school}_{year}_p{page_num:02d}.png"
-        image.save(image_path)
-
-        # Extract with Gemini
-        result = client.extract_from_image(image, REEXTRACT_PROMPT, page_num)
-
-        if not result.success:
-            print(f"  [ERROR] {result.error}")
-            return []
-
-        # Parse JSON response
-        import json
-        import re
-
-        response = result.question_text
-
-        # Find JSON in response
-        json_match = re.search(r'\{[\s\S]*\}', response)
-        if not json_match:
-            print(f"  [ERROR] No JSON found in response")
-            print(f"  Response: {response[:200]}...")
-            return []
-
-        try:
-            data = json.loads(json_match.group())
-        except json.JSONDecodeError as e:
-            print(f"  [ERROR] JSON parse error: {e}")
-            return []
-
-        questions = data.get("questions", [])
-        print(f"  Found {len(questions)} questions")
-
-        extracted = []
-        for q in questions:
-            qnum = q.get("question_number", 0)
-            marks = q.get("marks") or 2  # Default to 2 marks if not specified
-            text = q.get("question_text", "")
-            has_parts = q.get("has_parts", False)
-
-            # Determine section based on question number
-            if qnum <= 15:
-                section = "P1A"
-                stored_num = qnum
-            elif qnum <= 30:
-                section = "P1B"
-                stored_num = qnum - 15  # Q16->1, Q17->2, etc.
-            else:
-                section = "P2"
-                stored_num = qnum
-
-            if has_parts and q.get("parts"):
-                for part in q["parts"]:
-                    part_letter = part.get("part", "a")
-                    part_text = part.get("text", text)
-
-                    extracted.append({
-                        "school": school,
-                        "year": year,
-                        "section": section,
-                        "question_num": stored_num,
-                        "pdf_question_num": qnum,
-                        "part_letter": part_letter,
-                        "marks": marks,
-                        "text": part_text,
-                        "main_context": text,
-                        "image_path": str(image_path),
-                        "pdf_page_num": page_num,
-                    })
-                    print(f"    Q{qnum}({part_letter}): {part_text[:50]}...")
-            else:
-                extracted.append({
-                    "school": school,
-                    "year": year,
-                    "section": section,
-                    "question_num": stored_num,
-                    "pdf_question_num": qnum,
-                    "part_letter": None,
-                    "marks": marks,
-                    "text": text,
-                    "main_context": None,
-                    "image_path": str(image_path),
-                    "pdf_page_num": page_num,
-                })
-                print(f"    Q{qnum}: {text[:50]}...")
-
-        del image
-        gc.collect()
-
-        return extracted
-
-
-def save_questions(questions: list):
+        rendered.append((page_num, image, image_path))
+        pixmaps.append(pix)
+    return rendered, pixmaps
+
+
+def save_rendered_pages(rendered: list, pixmaps: list):
+    """Write pages from render_request_pages to their image paths as PNG.
+
+    MuPDF's own PNG encoder writes straight from the pixmap samples, which
+    is quicker than re-encoding the PIL copy.
+    """
+    for (_, _, image_path), pix in zip(rendered, pixmaps):
+        pix.save(str(image_path))
+
+
+def extract_with_backoff(client: GeminiClient, image, prompt: str, page_num: int) -> ExtractionResult:
+    """Call Gemini, retrying with exponential backoff while rate limited."""
+    for attempt in range(MAX_RETRIES):
+        result = client.extract_from_image(image, prompt, page_num)
+        if result.success or attempt == MAX_RETRIES - 1:
+            return result
+        error = (result.error or "").lower()
+        if not any(marker in error for marker in RATE_LIMIT_MARKERS):
+            return result
+        wait = 2 ** (attempt + 2)
+        print(f"  [Rate limited] Page {page_num}: retrying in {wait}s...")
+        time.sleep(wait)
+    return result
+
+
+def extract_page(client: GeminiClient, page: tuple, school: str, year: int):
+    """Re-extract a single rendered page (from render_request_pages)."""
+    page_num, image, image_path = page
+
+    result = extract_with_backoff(client, image, REEXTRACT_PROMPT, page_num)
+
+    if not result.success:
+        print(f"  [ERROR] Page {page_num}: {result.error}")
+        return []
+
+    data = parse_json_response(result.question_text)
+    if data is None:
+        return []
+
+    questions = data.get("questions", [])
+    print(f"  Page {page_num}: found {len(questions)} questions")
+
+    return build_questions(questions, school, year, page_num, image_path)
+
+
+def extract_pages_batch(client: GeminiClient, rendered: list, school: str, year: int):
+    """Re-extract several rendered pages (from render_request_pages) with one request."""
+    prompt = REEXTRACT_PROMPT + BATCH_PROMPT_SUFFIX.format(count=len(rendered))
+    images = [image for _, image, _ in rendered]
+    result = extract_with_backoff(client, images, prompt, rendered[0][0])
+
+    if not result.success:
+        print(f"  [ERROR] Pages {[p for p, _, _ in rendered]}: {result.error}")
+        return []
+
+    data = parse_json_response(result.question_text)
+    if data is None:
+        return []
+
+    extracted = []
+    seen = set()
+    for entry in data.get("pages", []):
+        index = entry.get("page_index")
+        if not isinstance(index, int) or not 0 <= index < len(rendered) or index in seen:
+            print(f"  [WARN] Ignoring result with page_index {index!r}")
+            continue
+        seen.add(index)
+        page_num, _, image_path = rendered[index]
+        questions = entry.get("questions", [])
+        print(f"  Page {page_num}: found {len(questions)} questions")
+        extracted.extend(build_questions(questions, school, year, page_num, image_path))
+
+    missing = [rendered[i][0] for i in range(len(rendered)) if i not in seen]
+    if missing:
+        print(f"  [WARN] No result for pages {missing} - re-run them with --batch-size 1")
+
+    return extracted
+
+
+def save_questions(questions: List[ExtractedQuestion]):
     """Save extracted questions to database."""
-    for q in questions:
-        try:
-            insert_question(
-                school=q["school"],
-                year=q["year"],
-                paper_section=q["section"],
-                question_num=q["question_num"],
-                marks=q["marks"],
-                latex_text=q["text"],
-                image_path=q["image_path"],
-                pdf_question_num=q["pdf_question_num"],
-                pdf_page_num=q["pdf_page_num"],
-                part_letter=q["part_letter"],
-                main_context=q["main_context"],
-            )
-            print(f"  Saved: {q['section']} Q{q['question_num']}")
-        except Exception as e:
-            print(f"  [ERROR] Failed to save Q{q['question_num']}: {e}")
+    # Field names match insert_question's arguments, so each instance's
+    # attribute dict is passed as-is rather than rebuilt per row
+    rows = [vars(q) for q in questions]
+
+    # One transaction for the batch, falling back to row by row so the
+    # good rows are kept and the bad ones are reported individually
+    for q, error in zip(questions, insert_questions_with_fallback(rows)):
+        if error is None:
+            print(f"  Saved: {q.paper_section} Q{q.question_num}")
+        else:
+            print(f"  [ERROR] Failed to save Q{q.question_num}: {error}")
 
 
 def main():
@@ -202,6 +327,8 @@ def main():
     parser.add_argument("--pdf", type=str, required=True, help="PDF filename")
     parser.add_argument("--pages", type=str, required=True, help="Pages to re-extract (comma-separated)")
     parser.add_argument("--save", action="store_true", help="Save to database (default: dry run)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help=f"Pages per Gemini request (default: {BATCH_SIZE}; 1 = one page per request)")
     args = parser.parse_args()
 
     api_key = os.environ.get("GEMINI_API_KEY")
@@ -217,15 +344,7 @@ def main():
         print(f"[ERROR] PDF not found: {args.pdf}")
         sys.exit(1)
 
-    # Parse school/year from filename
-    import re
-    name = pdf_path.stem
-    year_match = re.search(r"(\d{4})", name)
-    year = int(year_match.group(1)) if year_match else 2025
-
-    # Extract school name (last part after last hyphen)
-    parts = name.split("-")
-    school = parts[-1].strip() if len(parts) >= 5 else "Unknown"
+    school, year = parse_pdf_name(pdf_path)
 
     print("=" * 60)
     print("RE-EXTRACT SPECIFIC PAGES")
@@ -240,11 +359,33 @@ def main():
 
     pages = [int(p.strip()) for p in args.pages.split(",")]
 
+    # Requests run concurrently (GeminiClient still spaces their starts to
+    # stay within the rate limit). Rendering stays on this thread, since
+    # PyMuPDF is not thread-safe, and continues while requests are in flight.
+    # The PDF is opened and parsed once for every page rendered.
+    batch_size = max(1, args.batch_size)
     all_questions = []
-    for page_num in pages:
-        questions = extract_page(client, pdf_path, page_num, school, year)
-        all_questions.extend(questions)
-        time.sleep(1)  # Rate limit
+    with ThreadPoolExecutor(max_workers=REQUEST_WORKERS) as pool:
+        futures = []
+        with fitz.open(pdf_path) as doc:
+            for i in range(0, len(pages), batch_size):
+                batch = pages[i:i + batch_size]
+                print(f"\n[PAGES {', '.join(map(str, batch))}] Rendering...")
+                rendered, pixmaps = render_request_pages(doc, batch, school, year)
+                if not rendered:
+                    continue
+                if batch_size == 1:
+                    futures.append(pool.submit(extract_page, client, rendered[0], school, year))
+                else:
+                    futures.append(pool.submit(extract_pages_batch, client, rendered, school, year))
+                # PNG encoding is slow at this DPI; do it while the request is
+                # in flight rather than before sending it. A dry run only
+                # reports the image paths, so it writes nothing.
+                if args.save:
+                    save_rendered_pages(rendered, pixmaps)
+
+        for future in futures:
+            all_questions.extend(future.result())
 
     print(f"\n{'=' * 60}")
     print(f"SUMMARY: Extracted {len(all_questions)} questions from {len(pages)} pages")
@@ -21,8 +21,11 @@ import re
 import sys
 import json
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
 from PIL import Image
 
@@ -33,12 +36,26 @@ load_dotenv()
 sys.path.insert(0, str(Path(__file__).parent))
 
 from utils.gemini_client import GeminiClient
-from database import get_connection, get_questions, get_question, update_answer, get_all_schools
+from utils.json_extract import parse_first_json_object
+from database import get_connection, get_questions, update_answers, get_all_schools
 from config import IMAGES_DIR
 
 # Directory for answer key images
 ANSWER_KEY_DIR = IMAGES_DIR / "answer_keys"
 
+MCQ_DIGIT_RE = re.compile(r'[(\[]?([1-4])[)\]]?')
+DIGIT_TO_LETTER = {'1': 'A', '2': 'B', '3': 'C', '4': 'D'}
+MCQ_LETTERS = frozenset('ABCD')
+PAGE_NUM_RE = re.compile(r'p(\d+)')
+
+# Schools whose answer keys are read concurrently
+SCHOOL_WORKERS = 4
+
+# Longest edge of answer key pages sent to Gemini. Table digits stay
+# legible well below the client default, and a 1536px page is 4 of
+# Gemini's 768px tiles instead of 6 at 2048px.
+ANSWER_KEY_MAX_EDGE = 1536
+
 
 # P1A-specific extraction prompt targeting BOOKLET A table
 P1A_EXTRACTION_PROMPT = """This is an ANSWER KEY page from a P6 Math exam.
@@ -91,25 +108,27 @@ def normalize_mcq_answer(answer: str) -> str:
     """Convert digit (1-4) to letter (A-D)."""
     answer = str(answer).strip()
 
-    # If already a letter, return uppercase
-    if answer.upper() in ['A', 'B', 'C', 'D']:
-        return answer.upper()
+    # Common case: a bare digit, as the prompt asks for
+    if answer in DIGIT_TO_LETTER:
+        return DIGIT_TO_LETTER[answer]
 
-    # Convert digit to letter
-    mapping = {'1': 'A', '2': 'B', '3': 'C', '4': 'D'}
+    # If already a letter, return uppercase
+    upper = answer.upper()
+    if upper in MCQ_LETTERS:
+        return upper
 
     # Handle formats like "(3)", "[2]", "Option 1"
-    match = re.search(r'[(\[]?([1-4])[)\]]?', answer)
+    match = MCQ_DIGIT_RE.search(answer)
     if match:
-        digit = match.group(1)
-        return mapping.get(digit, answer)
+        return DIGIT_TO_LETTER[match.group(1)]
 
-    return mapping.get(answer, answer)
+    return answer
 
 
 def extract_p1a_from_answer_key(
     client: GeminiClient,
-    image_paths: List[Path]
+    image_paths: List[Path],
+    log: Callable[[str], None] = print,
 ) -> Dict[int, str]:
     """
     Extract Q1-Q15 answers from answer key images.
@@ -119,6 +138,7 @@ def extract_p1a_from_answer_key(
     Args:
         client: GeminiClient instance
         image_paths: List of answer key image paths
+        log: Called with each progress line (default: print them)
 
     Returns:
         Dict mapping question number to letter answer (e.g., {1: "A", 2: "B", ...})
@@ -127,39 +147,34 @@ def extract_p1a_from_answer_key(
 
     for img_path in image_paths:
         if not img_path.exists():
-            print(f"  [SKIP] Image not found: {img_path}")
+            log(f"  [SKIP] Image not found: {img_path}")
             continue
 
-        print(f"  Processing {img_path.name}... ", end="")
-
         try:
-            image = Image.open(img_path)
+            # The answer table is black-on-white print; a grayscale JPEG
+            # carries it in a third of the bytes
+            image = Image.open(img_path).convert("L")
         except Exception as e:
-            print(f"[ERROR] {e}")
+            log(f"  {img_path.name}: [ERROR] {e}")
             continue
 
         # Send to Gemini with P1A-specific prompt
         result = client.extract_from_image(image, P1A_EXTRACTION_PROMPT)
 
         if not result.success:
-            print(f"[ERROR] {result.error}")
+            log(f"  {img_path.name}: [ERROR] {result.error}")
             continue
 
         response_text = result.question_text
 
         # Parse JSON response
         try:
-            # Find JSON in response
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}') + 1
-
-            if json_start >= 0 and json_end > json_start:
-                json_str = response_text[json_start:json_end]
-                answers_dict = json.loads(json_str)
+            answers_dict = parse_first_json_object(response_text)
 
+            if answers_dict is not None:
                 # Check for error response
                 if "error" in answers_dict:
-                    print(f"[{answers_dict['error']}]")
+                    log(f"  {img_path.name}: [{answers_dict['error']}]")
                     continue
 
                 # Extract and normalize answers
@@ -175,50 +190,93 @@ def extract_p1a_from_answer_key(
                     except (ValueError, TypeError):
                         continue
 
-                print(f"[found {found_count} answers]")
+                log(f"  {img_path.name}: [found {found_count} answers]")
 
                 # If we found answers, we can stop
                 if found_count >= 10:  # Reasonable threshold
                     break
             else:
-                print("[no JSON found]")
+                log(f"  {img_path.name}: [no JSON found]")
 
         except json.JSONDecodeError as e:
-            print(f"[JSON error: {e}]")
+            log(f"  {img_path.name}: [JSON error: {e}]")
             continue
 
     return all_answers
 
 
+def page_sort_key(path: Path) -> int:
+    """Page number in an answer key image filename (0 if none)."""
+    match = PAGE_NUM_RE.search(path.name)
+    return int(match.group(1)) if match else 0
+
+
+@lru_cache(maxsize=None)
+def answer_key_filenames() -> Tuple[str, ...]:
+    """PNG filenames in ANSWER_KEY_DIR, listed once per run and shared by every school."""
+    if not ANSWER_KEY_DIR.is_dir():
+        return ()
+    with os.scandir(ANSWER_KEY_DIR) as entries:
+        return tuple(e.name for e in entries if e.name.endswith(".png"))
+
+
 def get_answer_key_images(school: str, year: int = 2025) -> List[Path]:
     """Find answer key images for a school."""
-    # Handle variations in school name
-    school_normalized = school.replace(" ", "_")
-
-    # Look for matching files
-    pattern = f"{school}_{year}_answer_*.png"
-    images = list(ANSWER_KEY_DIR.glob(pattern))
+    filenames = answer_key_filenames()
 
-    # Also try with underscores
-    if not images:
-        pattern = f"{school_normalized}_{year}_answer_*.png"
-        images = list(ANSWER_KEY_DIR.glob(pattern))
+    # Match "{school}_{year}_answer_*.png", trying the name as given and
+    # then with spaces replaced by underscores
+    images = []
+    for name_variant in (school, school.replace(" ", "_")):
+        prefix = f"{name_variant}_{year}_answer_"
+        images = [ANSWER_KEY_DIR / name for name in filenames if name.startswith(prefix)]
+        if images:
+            break
 
     # Sort by page number
-    images.sort(key=lambda p: int(re.search(r'p(\d+)', p.name).group(1)) if re.search(r'p(\d+)', p.name) else 0)
+    images.sort(key=page_sort_key)
 
     return images
 
 
+@dataclass
+class AnswerKey:
+    """A school's answer key images and the P1A answers read from them."""
+    images: List[Path]
+    answers: Dict[int, str] = field(default_factory=dict)
+    log: List[str] = field(default_factory=list)  # progress lines, not yet printed
+
+
+def read_answer_key(client: GeminiClient, school: str, year: int) -> AnswerKey:
+    """Extract a school's P1A answers from its answer key images.
+
+    Safe to run for several schools at once: progress lines are kept on
+    the result for fix_school_p1a to print with the rest of the school's
+    output, rather than printed here.
+    """
+    key = AnswerKey(images=get_answer_key_images(school, year))
+    if key.images:
+        key.answers = extract_p1a_from_answer_key(client, key.images, log=key.log.append)
+    return key
+
+
 def fix_school_p1a(
     client: GeminiClient,
     school: str,
     year: int = 2025,
-    dry_run: bool = False
+    dry_run: bool = False,
+    questions: Optional[List[dict]] = None,
+    answer_key: Optional[AnswerKey] = None
 ) -> Dict[str, int]:
     """
     Fix P1A answers for a specific school.
 
+    Args:
+        questions: The school's P1A questions, if already fetched
+                   (default: query them)
+        answer_key: The school's answer key from read_answer_key, if
+                    already read (default: read it here)
+
     Returns stats dict with counts of updated/skipped/errors.
     """
     stats = {"updated": 0, "skipped": 0, "errors": 0}
@@ -227,8 +285,10 @@ def fix_school_p1a(
     print(f"Processing {school} ({year})")
     print(f"{'='*50}")
 
-    # Find answer key images
-    images = get_answer_key_images(school, year)
+    # Find answer key images and read the P1A answers from them
+    if answer_key is None:
+        answer_key = read_answer_key(client, school, year)
+    images = answer_key.images
 
     if not images:
         print(f"  [WARNING] No answer key images found for {school}")
@@ -238,8 +298,9 @@ def fix_school_p1a(
 
     print(f"  Found {len(images)} answer key images")
 
-    # Extract P1A answers from images
-    p1a_answers = extract_p1a_from_answer_key(client, images)
+    for line in answer_key.log:
+        print(line)
+    p1a_answers = answer_key.answers
 
     if not p1a_answers:
         print(f"  [WARNING] Could not extract P1A answers from existing images")
@@ -251,7 +312,8 @@ def fix_school_p1a(
     print(f"  Extracted answers: {p1a_answers}")
 
     # Get current P1A questions from database
-    questions = get_questions(school=school, year=year, paper_section='P1A')
+    if questions is None:
+        questions = get_questions(school=school, year=year, paper_section='P1A')
 
     if not questions:
         print(f"  [WARNING] No P1A questions found in database for {school}")
@@ -260,7 +322,8 @@ def fix_school_p1a(
 
     print(f"  Found {len(questions)} P1A questions in database")
 
-    # Update each question
+    # Update each question (writes are queued and committed together below)
+    pending = []  # (question_id, answer, worked_solution)
     for q in questions:
         q_num = q['question_num']
         current_answer = q.get('answer', '')
@@ -279,31 +342,18 @@ def fix_school_p1a(
                     print(" [dry-run]")
                     stats["updated"] += 1
                 else:
-                    # Look up question ID first
-                    q = get_question(school, year, 'P1A', q_num)
-                    if not q:
-                        print(" [NOT FOUND]")
-                        stats["errors"] += 1
-                        continue
-
-                    # Update database
-                    success = update_answer(
-                        question_id=q['id'],
-                        answer=new_answer,
-                        worked_solution="[fix_p1a_mcq]",
-                        overwrite=True
-                    )
-
-                    if success:
-                        print(" [updated]")
-                        stats["updated"] += 1
-                    else:
-                        print(" [FAILED]")
-                        stats["errors"] += 1
+                    pending.append((q['id'], new_answer, "[fix_p1a_mcq]"))
+                    print(" [queued]")
         else:
             print(f"    Q{q_num}: No answer found in key")
             stats["errors"] += 1
 
+    if pending:
+        updated = update_answers(pending)
+        print(f"  Updated {updated}/{len(pending)} answers")
+        stats["updated"] += updated
+        stats["errors"] += len(pending) - updated
+
     return stats
 
 
@@ -344,7 +394,7 @@ def main():
     if args.dry_run:
         print("\n[DRY RUN MODE - no changes will be made]")
 
-    client = GeminiClient(api_key=api_key)
+    client = GeminiClient(api_key=api_key, max_image_edge=ANSWER_KEY_MAX_EDGE)
 
     # Determine which schools to process
     if args.school:
@@ -354,14 +404,30 @@ def main():
 
     print(f"\nProcessing {len(schools)} school(s)...")
 
-    # Process each school
-    total_stats = {"updated": 0, "skipped": 0, "errors": 0}
+    # Fetch every P1A question for the year in one query, grouped by school
+    p1a_by_school: Dict[str, List[dict]] = {}
+    for q in get_questions(year=args.year, paper_section='P1A'):
+        p1a_by_school.setdefault(q['school'], []).append(q)
 
-    for school in schools:
-        stats = fix_school_p1a(client, school, args.year, args.dry_run)
+    # Process each school. Reading the answer keys (Gemini calls) is the
+    # slow part and schools are independent, so keys are read concurrently;
+    # GeminiClient still spaces request starts to stay within the rate
+    # limit. Database updates are then applied one school at a time, in order.
+    total_stats = {"updated": 0, "skipped": 0, "errors": 0}
 
-        for key in total_stats:
-            total_stats[key] += stats[key]
+    with ThreadPoolExecutor(max_workers=SCHOOL_WORKERS) as pool:
+        answer_futures = [
+            pool.submit(read_answer_key, client, school, args.year) for school in schools
+        ]
+        for school, future in zip(schools, answer_futures):
+            stats = fix_school_p1a(
+                client, school, args.year, args.dry_run,
+                questions=p1a_by_school.get(school, []),
+                answer_key=future.result()
+            )
+
+            for key in total_stats:
+                total_stats[key] += stats[key]
 
     # Summary
     print(f"\n{'='*60}")
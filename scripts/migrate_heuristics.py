@@ -39,17 +39,16 @@ REMAP = {
     "Visual Regrouping (Cut & Paste)": "Spatial Reasoning",
 }
 
-VALID_HEURISTICS = set(HEURISTICS)
+VALID_HEURISTICS = frozenset(HEURISTICS)
+NEEDS_REMAP = frozenset(REMAP)
+
+# Updates per Firestore batched write (the limit is 500)
+WRITE_BATCH_SIZE = 450
 
 
 def remap_heuristics(heuristics: list) -> list:
-    """Remap old heuristic names and deduplicate."""
-    result = []
-    for h in heuristics:
-        new_name = REMAP.get(h, h)
-        if new_name not in result:
-            result.append(new_name)
-    return result
+    """Remap old heuristic names and deduplicate (keeping first-seen order)."""
+    return list(dict.fromkeys(REMAP.get(h, h) for h in heuristics))
 
 
 def main():
@@ -63,7 +62,7 @@ def main():
 
     # Import Firebase
     try:
-        from firebase_db import get_questions, update_topic_tags
+        from firebase_db import iter_questions, update_heuristics_batch
     except Exception as e:
         print(f"[ERROR] Could not import firebase_db: {e}")
         print("Make sure firebase-key.json is present and dependencies are installed.")
@@ -77,15 +76,27 @@ def main():
     else:
         print("[APPLY MODE] Changes will be saved to Firebase.\n")
 
-    questions = get_questions()
-    print(f"Total questions: {len(questions)}\n")
-
+    total = 0
     changed = 0
     unchanged = 0
     untagged = 0
     invalid_after = []
+    pending = []  # (question_id, heuristics) awaiting a batched write
 
-    for q in questions:
+    def flush():
+        """Write the pending updates in one batch."""
+        nonlocal changed
+        if update_heuristics_batch(pending):
+            changed += len(pending)
+        else:
+            print(f"    [ERROR] Failed to update batch of {len(pending)}: "
+                  f"{[q_id for q_id, _ in pending]}")
+        pending.clear()
+
+    # Documents are streamed and updates written in batches as they go,
+    # so the collection is never loaded into memory all at once
+    for q in iter_questions():
+        total += 1
         q_id = q.get("id", "?")
         old_heuristics = q.get("heuristics") or []
 
@@ -93,6 +104,12 @@ def main():
             untagged += 1
             continue
 
+        # Most questions use only current names and no duplicates; skip
+        # those without building a remapped list to compare
+        if NEEDS_REMAP.isdisjoint(old_heuristics) and len(set(old_heuristics)) == len(old_heuristics):
+            unchanged += 1
+            continue
+
         new_heuristics = remap_heuristics(old_heuristics)
 
         # Check if anything changed
@@ -116,21 +133,19 @@ def main():
         print(f"    NEW: {new_heuristics}")
 
         if args.apply:
-            ok = update_topic_tags(
-                question_id=q_id,
-                heuristics=new_heuristics,
-            )
-            if ok:
-                changed += 1
-            else:
-                print(f"    [ERROR] Failed to update {q_id}")
+            pending.append((q_id, new_heuristics))
+            if len(pending) >= WRITE_BATCH_SIZE:
+                flush()
         else:
             changed += 1
 
+    if pending:
+        flush()
+
     print(f"\n{'=' * 60}")
     print("SUMMARY")
     print("=" * 60)
-    print(f"Total questions:  {len(questions)}")
+    print(f"Total questions:  {total}")
     print(f"Untagged:         {untagged}")
     print(f"Unchanged:        {unchanged}")
     print(f"Remapped:         {changed}")
@@ -5,10 +5,12 @@ Migrate data from SQLite to Firebase.
 Usage:
     python migrate_to_firebase.py
     python migrate_to_firebase.py --upload-images  # Also upload images to Firebase Storage
+    python migrate_to_firebase.py --images-only --workers 32
 """
 
 import argparse
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent))
@@ -16,25 +18,43 @@ sys.path.insert(0, str(Path(__file__).parent))
 from firebase_db import migrate_from_sqlite, init_firebase, get_statistics, upload_image
 from config import DATABASE_PATH, IMAGES_DIR
 
+# Concurrent uploads to Firebase Storage (each upload is one HTTPS request)
+UPLOAD_WORKERS = 16
 
-def migrate_images():
-    """Upload all local images to Firebase Storage."""
+
+def _upload_files(files, storage_prefix: str, progress_every: int, workers: int) -> int:
+    """Upload files concurrently; returns the number uploaded successfully."""
+    def upload_one(img_path):
+        upload_image(str(img_path), f"{storage_prefix}{img_path.name}")
+
+    uploaded = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(upload_one, p): p for p in files}
+        for i, future in enumerate(as_completed(futures)):
+            try:
+                future.result()
+                uploaded += 1
+            except Exception as e:
+                print(f"  Error uploading {futures[future].name}: {e}")
+            if progress_every and (i + 1) % progress_every == 0:
+                print(f"  Uploaded {i + 1}/{len(files)}")
+    return uploaded
+
+
+def migrate_images(workers: int = UPLOAD_WORKERS):
+    """Upload all local images to Firebase Storage.
+
+    Uploads are network-bound, so they run on a thread pool rather than
+    one after another.
+    """
     print("\nUploading images to Firebase Storage...")
 
     # Question page images
     image_files = list(IMAGES_DIR.glob("*.png"))
     print(f"Found {len(image_files)} question images")
 
-    for i, img_path in enumerate(image_files):
-        storage_path = f"images/{img_path.name}"
-        try:
-            url = upload_image(str(img_path), storage_path)
-            if (i + 1) % 50 == 0:
-                print(f"  Uploaded {i + 1}/{len(image_files)}")
-        except Exception as e:
-            print(f"  Error uploading {img_path.name}: {e}")
-
-    print(f"Uploaded {len(image_files)} question images")
+    uploaded = _upload_files(image_files, "images/", 50, workers)
+    print(f"Uploaded {uploaded} question images")
 
     # Answer key images
     answer_key_dir = IMAGES_DIR / "answer_keys"
@@ -42,32 +62,17 @@ def migrate_images():
         answer_images = list(answer_key_dir.glob("*.png"))
         print(f"\nFound {len(answer_images)} answer key images")
 
-        for i, img_path in enumerate(answer_images):
-            storage_path = f"images/answer_keys/{img_path.name}"
-            try:
-                url = upload_image(str(img_path), storage_path)
-                if (i + 1) % 20 == 0:
-                    print(f"  Uploaded {i + 1}/{len(answer_images)}")
-            except Exception as e:
-                print(f"  Error uploading {img_path.name}: {e}")
-
-        print(f"Uploaded {len(answer_images)} answer key images")
+        uploaded = _upload_files(answer_images, "images/answer_keys/", 20, workers)
+        print(f"Uploaded {uploaded} answer key images")
 
     # Solution images
     solutions_dir = IMAGES_DIR / "solutions"
     if solutions_dir.exists():
-        solution_images = list(solutions_dir.glob("*"))
+        solution_images = [p for p in solutions_dir.glob("*") if p.is_file()]
         print(f"\nFound {len(solution_images)} solution images")
 
-        for img_path in solution_images:
-            if img_path.is_file():
-                storage_path = f"images/solutions/{img_path.name}"
-                try:
-                    upload_image(str(img_path), storage_path)
-                except Exception as e:
-                    print(f"  Error uploading {img_path.name}: {e}")
-
-        print(f"Uploaded {len(solution_images)} solution images")
+        uploaded = _upload_files(solution_images, "images/solutions/", 0, workers)
+        print(f"Uploaded {uploaded} solution images")
 
 
 def main():
@@ -82,6 +87,12 @@ def main():
         action="store_true",
         help="Only upload images, skip database migration"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=UPLOAD_WORKERS,
+        help=f"Concurrent image uploads (default: {UPLOAD_WORKERS})"
+    )
     args = parser.parse_args()
 
     print("=" * 60)
@@ -111,7 +122,7 @@ def main():
         print(f"By school: {stats['by_school']}")
 
     if args.upload_images or args.images_only:
-        migrate_images()
+        migrate_images(workers=args.workers)
 
     print("\n" + "=" * 60)
     print("MIGRATION COMPLETE")
@@ -23,9 +23,11 @@ import os
 import re
 import sys
 import argparse
-import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 
 from PIL import Image
 
@@ -35,6 +37,30 @@ from utils.gemini_client import GeminiClient
 from database import get_questions, get_connection
 from config import IMAGES_DIR
 
+WORKING_RE = re.compile(r'WORKING:\s*\n(.*?)(?=\nANSWER:|\n---|\Z)', re.DOTALL | re.IGNORECASE)
+ANSWER_RE = re.compile(r'ANSWER:\s*\n?(.*?)(?=\n---|\Z)', re.DOTALL | re.IGNORECASE)
+ANSWER_FALLBACK_RE = re.compile(r'(?:answer|ans)(?:\s+is)?[:\s]+([^\n]+)', re.IGNORECASE)
+ANSWER_PREFIX_RE = re.compile(r'^(?:ans|answer)[:\s]*')
+WHITESPACE_RE = re.compile(r'\s+')
+NUMBER_RE = re.compile(r'[\d.]+')
+
+# Questions solved concurrently. Wall time is mostly waiting on Gemini, and
+# GeminiClient spaces request starts to stay within the rate limit.
+SOLVE_WORKERS = 4
+
+# Questions submitted ahead of the one being reported. Keeps the pool busy
+# without queueing the whole run (and every loaded image) up front.
+SOLVE_IN_FLIGHT = SOLVE_WORKERS * 2
+
+# Solved answers are written in one transaction per this many questions,
+# rather than committing each row
+SOLUTION_FLUSH_EVERY = 16
+
+# Longest edge of question images sent to Gemini. Crops are page-width
+# (1654px at 200 DPI); at 1536px a typical crop is 2 of Gemini's 768px
+# tiles wide instead of 3, with printed text still legible.
+QUESTION_MAX_EDGE = 1536
+
 # Prompt for solving questions
 SOLVE_QUESTION_PROMPT = """You are a P6 Math teacher solving this exam question.
 
@@ -93,20 +119,12 @@ def parse_solution_response(response: str) -> Tuple[Optional[str], Optional[str]
     answer = None
 
     # Try to extract WORKING section
-    working_match = re.search(
-        r'WORKING:\s*\n(.*?)(?=\nANSWER:|\n---|\Z)',
-        response,
-        re.DOTALL | re.IGNORECASE
-    )
+    working_match = WORKING_RE.search(response)
     if working_match:
         working = working_match.group(1).strip()
 
     # Try to extract ANSWER section
-    answer_match = re.search(
-        r'ANSWER:\s*\n?(.*?)(?=\n---|\Z)',
-        response,
-        re.DOTALL | re.IGNORECASE
-    )
+    answer_match = ANSWER_RE.search(response)
     if answer_match:
         answer = answer_match.group(1).strip()
         # Clean up answer - take first line if multiple lines
@@ -117,21 +135,45 @@ def parse_solution_response(response: str) -> Tuple[Optional[str], Optional[str]
     # Fallback: look for common answer patterns
     if not answer:
         # Look for "The answer is X" pattern
-        ans_pattern = re.search(r'(?:answer|ans)(?:\s+is)?[:\s]+([^\n]+)', response, re.IGNORECASE)
+        ans_pattern = ANSWER_FALLBACK_RE.search(response)
         if ans_pattern:
             answer = ans_pattern.group(1).strip()
 
     return working, answer
 
 
+def load_question_image(question: dict) -> Tuple[Optional[Image.Image], Optional[str]]:
+    """
+    Open and fully decode a question's image.
+
+    Returns: (image, error) - image is None if it could not be loaded
+    """
+    image_path = Path(question['image_path'])
+    if not image_path.exists():
+        return None, f"Image not found: {image_path}"
+
+    try:
+        image = Image.open(image_path)
+        image.load()  # decode now, not lazily on first use
+    except Exception as e:
+        return None, f"Failed to load image: {e}"
+
+    return image, None
+
+
 def solve_question(
     client: GeminiClient,
     question: dict,
-    force: bool = False
+    force: bool = False,
 ) -> Tuple[bool, Optional[str], Optional[str]]:
     """
     Use Gemini to solve a question.
 
+    Args:
+        client: Gemini client
+        question: Question row
+        force: Re-solve even if the question already has an answer
+
     Returns: (success, working, answer)
     """
     # Skip if already has answer and not forcing
@@ -139,15 +181,9 @@ def solve_question(
         return False, None, None
 
     # Load the question image
-    image_path = Path(question['image_path'])
-    if not image_path.exists():
-        print(f"[ERROR] Image not found: {image_path}")
-        return False, None, None
-
-    try:
-        image = Image.open(image_path)
-    except Exception as e:
-        print(f"[ERROR] Failed to load image: {e}")
+    image, error = load_question_image(question)
+    if image is None:
+        print(f"[ERROR] {error}")
         return False, None, None
 
     # Choose prompt based on question type
@@ -172,27 +208,31 @@ def solve_question(
     return True, working, answer
 
 
-def update_question_solution(
-    question_id: int,
-    answer: str,
-    working: Optional[str] = None,
+def update_question_solutions(
+    solutions: List[Tuple[int, str, Optional[str]]],
     source: str = "ai_generated"
-) -> bool:
-    """Update question with AI-generated solution."""
-    with get_connection() as conn:
-        # Add source tag to working to indicate it's AI-generated
-        if working:
-            working = f"[{source}]\n{working}"
+) -> int:
+    """
+    Update many questions with AI-generated solutions in a single transaction.
+
+    Each solution is (question_id, answer, working). Working steps are
+    prefixed with a [source] tag to mark them as AI-generated.
 
-        cursor = conn.execute(
+    Returns: Number of questions updated
+    """
+    with get_connection() as conn:
+        cursor = conn.executemany(
             """
             UPDATE questions
             SET answer = ?, worked_solution = ?
             WHERE id = ?
             """,
-            (answer, working, question_id)
+            [
+                (answer, f"[{source}]\n{working}" if working else working, question_id)
+                for question_id, answer, working in solutions
+            ]
         )
-        return cursor.rowcount > 0
+        return cursor.rowcount
 
 
 def verify_answer(ai_answer: str, existing_answer: Optional[str]) -> Tuple[bool, str]:
@@ -203,15 +243,19 @@ def verify_answer(ai_answer: str, existing_answer: Optional[str]) -> Tuple[bool,
     if not existing_answer:
         return True, "No existing answer to compare"
 
+    # Identical strings normalize identically, so skip the regex work
+    if ai_answer == existing_answer:
+        return True, "Exact match"
+
     # Normalize both answers for comparison
     def normalize(ans):
         if not ans:
             return ""
         ans = ans.lower().strip()
         # Remove common prefixes
-        ans = re.sub(r'^(?:ans|answer)[:\s]*', '', ans)
+        ans = ANSWER_PREFIX_RE.sub('', ans)
         # Normalize spaces
-        ans = re.sub(r'\s+', ' ', ans)
+        ans = WHITESPACE_RE.sub(' ', ans)
         # Remove $ for comparison
         ans = ans.replace('$', '')
         return ans
@@ -229,8 +273,8 @@ def verify_answer(ai_answer: str, existing_answer: Optional[str]) -> Tuple[bool,
 
     # Try numeric comparison
     try:
-        ai_num = float(re.search(r'[\d.]+', ai_norm).group())
-        existing_num = float(re.search(r'[\d.]+', existing_norm).group())
+        ai_num = float(NUMBER_RE.search(ai_norm).group())
+        existing_num = float(NUMBER_RE.search(existing_norm).group())
         if abs(ai_num - existing_num) < 0.01:
             return True, f"Numeric match: {ai_num}"
     except:
@@ -239,6 +283,50 @@ def verify_answer(ai_answer: str, existing_answer: Optional[str]) -> Tuple[bool,
     return False, f"MISMATCH: AI='{ai_answer}' vs Existing='{existing_answer}'"
 
 
+def report_solution(
+    q: dict,
+    result: Tuple[bool, Optional[str], Optional[str]],
+    verify: bool,
+    stats: dict,
+    index: int,
+    total: int,
+    pending: List[Tuple[int, str, Optional[str]]],
+):
+    """
+    Print and optionally verify one solve_question result, updating stats.
+
+    A solved answer is queued on pending for update_question_solutions.
+    """
+    section = q['paper_section']
+    qnum = q['question_num']
+    print(f"\n[{index+1}/{total}] {section} Q{qnum}... ", end="")
+
+    # Store existing answer for verification
+    existing_answer = q.get('answer')
+
+    success, working, answer = result
+
+    if success and answer:
+        print(f"[SOLVED] {answer[:40]}{'...' if len(answer) > 40 else ''}")
+
+        # Verify if requested
+        if verify and existing_answer:
+            matches, explanation = verify_answer(answer, existing_answer)
+            if matches:
+                print(f"    [VERIFIED] {explanation}")
+                stats["verified"] += 1
+            else:
+                print(f"    [WARNING] {explanation}")
+                stats["mismatched"] += 1
+
+        # Queue database update
+        pending.append((q['id'], answer, working))
+        stats["solved"] += 1
+    else:
+        print("[FAILED]")
+        stats["failed"] += 1
+
+
 def main():
     parser = argparse.ArgumentParser(description="Solve questions using Gemini AI")
     parser.add_argument("--section", type=str, help="Only solve questions in this section (P1A, P1B, P2)")
@@ -261,7 +349,7 @@ def main():
 
     # Init Gemini
     print("\n[INIT] Connecting to Gemini...")
-    client = GeminiClient(api_key=api_key)
+    client = GeminiClient(api_key=api_key, max_image_edge=QUESTION_MAX_EDGE)
 
     # Get questions to solve
     query_params = {}
@@ -289,38 +377,30 @@ def main():
     # Process each question
     stats = {"solved": 0, "failed": 0, "verified": 0, "mismatched": 0}
 
-    for i, q in enumerate(questions):
-        section = q['paper_section']
-        qnum = q['question_num']
-        print(f"\n[{i+1}/{len(questions)}] {section} Q{qnum}... ", end="")
-
-        # Store existing answer for verification
-        existing_answer = q.get('answer')
-
-        success, working, answer = solve_question(client, q, force=args.force)
-
-        if success and answer:
-            print(f"[SOLVED] {answer[:40]}{'...' if len(answer) > 40 else ''}")
-
-            # Verify if requested
-            if args.verify and existing_answer:
-                matches, explanation = verify_answer(answer, existing_answer)
-                if matches:
-                    print(f"    [VERIFIED] {explanation}")
-                    stats["verified"] += 1
-                else:
-                    print(f"    [WARNING] {explanation}")
-                    stats["mismatched"] += 1
-
-            # Update database
-            update_question_solution(q['id'], answer, working)
-            stats["solved"] += 1
-        else:
-            print("[FAILED]")
-            stats["failed"] += 1
-
-        # Rate limiting
-        time.sleep(1)
+    # Workers load each image and call Gemini; results are reported and
+    # written to the database here, in question order. If the run stops
+    # early, queued questions are cancelled and solved answers still saved.
+    pending = []
+    pool = ThreadPoolExecutor(max_workers=SOLVE_WORKERS)
+    try:
+        upcoming = iter(questions)
+        futures = deque(
+            pool.submit(solve_question, client, q, args.force)
+            for q in islice(upcoming, SOLVE_IN_FLIGHT)
+        )
+        for i, q in enumerate(questions):
+            result = futures.popleft().result()
+            next_q = next(upcoming, None)
+            if next_q is not None:
+                futures.append(pool.submit(solve_question, client, next_q, args.force))
+            report_solution(q, result, args.verify, stats, i, len(questions), pending)
+            if len(pending) >= SOLUTION_FLUSH_EVERY:
+                update_question_solutions(pending)
+                pending.clear()
+    finally:
+        pool.shutdown(cancel_futures=True)
+        if pending:
+            update_question_solutions(pending)
 
     # Summary
     print(f"\n{'=' * 60}")
@@ -15,6 +15,7 @@ Usage:
 
     # Pass 2 — full run with few-shot examples
     python tag_topics.py --force --examples few_shot_examples.json
+    python tag_topics.py --force --examples few_shot_examples.json --batch-api   # cheaper, slower
 
     # Utilities
     python tag_topics.py --school "Tao Nan" --section P2
@@ -22,17 +23,22 @@ Usage:
 """
 
 import os
-import re
 import sys
 import json
 import time
 import argparse
 import io
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
 from pathlib import Path
-from typing import Optional, Dict, List
+from typing import Optional, Dict, Iterator, List
 from difflib import get_close_matches
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from PIL import Image
 
 sys.path.insert(0, str(Path(__file__).parent))
@@ -41,14 +47,15 @@ from config import (
     TOPICS, HEURISTICS,
     TOPIC_CLASSIFICATION_PROMPT,
 )
-from utils.gemini_client import GeminiClient
+from utils.gemini_client import EncodedImage, GeminiClient
+from utils.json_extract import parse_first_json_object
 
 # Use Firebase by default, SQLite fallback
 USE_FIREBASE = os.environ.get('USE_FIREBASE', 'true').lower() == 'true'
 
 try:
     if USE_FIREBASE:
-        from firebase_db import get_questions, update_topic_tags
+        from firebase_db import get_questions, update_topic_tags_bulk
         USING_FIREBASE = True
     else:
         raise ImportError("Firebase disabled")
@@ -56,12 +63,9 @@ except Exception:
     from database import get_questions
     USING_FIREBASE = False
 
-    def update_topic_tags(question_id, topics=None,
-                          heuristics=None, confidence=None, needs_review=False):
-        """SQLite fallback for update_topic_tags."""
-        import sqlite3
-        from config import DATABASE_PATH
-        conn = sqlite3.connect(DATABASE_PATH)
+    def _topic_tags_update(question_id, topics=None,
+                           heuristics=None, confidence=None, needs_review=False):
+        """SQLite UPDATE statement and parameters for one question's tags."""
         updates = []
         params = []
         if topics is not None:
@@ -75,23 +79,49 @@ except Exception:
             params.append(confidence)
         updates.append("needs_review = ?")
         params.append(1 if needs_review else 0)
-
-        if not updates:
-            conn.close()
-            return False
         params.append(question_id)
-        query = f"UPDATE questions SET {', '.join(updates)} WHERE id = ?"
-        cursor = conn.execute(query, params)
-        conn.commit()
-        ok = cursor.rowcount > 0
+        return f"UPDATE questions SET {', '.join(updates)} WHERE id = ?", params
+
+    def update_topic_tags_bulk(updates):
+        """SQLite fallback for update_topic_tags_bulk: all updates in one transaction."""
+        import sqlite3
+        from config import DATABASE_PATH
+        conn = sqlite3.connect(DATABASE_PATH)
+        failed = []
+        with conn:
+            for question_id, tags in updates:
+                cursor = conn.execute(*_topic_tags_update(question_id, **tags))
+                if cursor.rowcount == 0:
+                    failed.append(question_id)
         conn.close()
-        return ok
+        return failed
 
 
+# Shared HTTP session for downloading question images from Firebase Storage:
+# keep-alive reuses one connection instead of a new TLS handshake per question
+_http = requests.Session()
+_http.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504)),
+))
+
+# Questions classified concurrently by default. Each call is seconds of
+# network wait; GeminiClient spaces request starts to stay within the rate
+# limit, and this stays under the image session's pool_maxsize.
+TAG_WORKERS = 4
+
+# Classified questions saved per bulk write, rather than one write each
+TAG_FLUSH_EVERY = 50
+
 # All valid tags for validation
 ALL_TOPICS = set(TOPICS)
 ALL_HEURISTICS = set(HEURISTICS)
 
+# Lowercased name -> canonical tag, for case-insensitive matching
+TOPICS_BY_LOWER = {t.lower(): t for t in ALL_TOPICS}
+HEURISTICS_BY_LOWER = {h.lower(): h for h in ALL_HEURISTICS}
+
 # Remap old heuristic names (26 → 15 consolidation)
 HEURISTIC_REMAP = {
     "All Items Changed": "Before-After",
@@ -135,14 +165,22 @@ def load_few_shot_examples(path: str) -> str:
     return "\n".join(lines)
 
 
-def fuzzy_match_tag(value: str, valid_set: set) -> Optional[str]:
-    """Try to fuzzy-match a tag against valid tags. Returns match or None."""
+def fuzzy_match_tag(
+    value: str, valid_set: set, by_lower: Optional[Dict[str, str]] = None
+) -> Optional[str]:
+    """Try to fuzzy-match a tag against valid tags. Returns match or None.
+
+    by_lower maps each valid tag's lowercased name to the tag; pass the
+    prebuilt TOPICS_BY_LOWER / HEURISTICS_BY_LOWER to avoid rebuilding it.
+    """
     if value in valid_set:
         return value
     # Try case-insensitive exact match
-    for v in valid_set:
-        if v.lower() == value.lower():
-            return v
+    if by_lower is None:
+        by_lower = {v.lower(): v for v in valid_set}
+    exact = by_lower.get(value.lower())
+    if exact:
+        return exact
     # Try close matches
     matches = get_close_matches(value, valid_set, n=1, cutoff=0.8)
     return matches[0] if matches else None
@@ -156,7 +194,7 @@ def validate_tags(result: dict) -> dict:
     cleaned = {"topics": [], "heuristics": []}
 
     for raw_topic in result.get("topics", []):
-        matched = fuzzy_match_tag(raw_topic, ALL_TOPICS)
+        matched = fuzzy_match_tag(raw_topic, ALL_TOPICS, TOPICS_BY_LOWER)
         if matched:
             cleaned["topics"].append(matched)
         else:
@@ -165,7 +203,7 @@ def validate_tags(result: dict) -> dict:
     for raw_h in result.get("heuristics", []):
         # Remap old heuristic names to consolidated names
         remapped = HEURISTIC_REMAP.get(raw_h, raw_h)
-        matched = fuzzy_match_tag(remapped, ALL_HEURISTICS)
+        matched = fuzzy_match_tag(remapped, ALL_HEURISTICS, HEURISTICS_BY_LOWER)
         if matched:
             if matched not in cleaned["heuristics"]:
                 cleaned["heuristics"].append(matched)
@@ -195,7 +233,7 @@ def load_question_image(q: dict) -> Optional[Image.Image]:
 
     if image_path_str.startswith("http"):
         try:
-            resp = requests.get(image_path_str, timeout=30)
+            resp = _http.get(image_path_str, timeout=30)
             resp.raise_for_status()
             return Image.open(io.BytesIO(resp.content))
         except Exception as e:
@@ -209,6 +247,26 @@ def load_question_image(q: dict) -> Optional[Image.Image]:
         return None
 
 
+def load_question_image_encoded(client: GeminiClient, q: dict) -> Optional[EncodedImage]:
+    """Load a question image and encode it for the Batch API, closing it."""
+    image = load_question_image(q)
+    if image is None:
+        return None
+    with image:
+        return client.encode_for_batch(image)
+
+
+def build_classification_prompt(q: dict, few_shot_text: str) -> str:
+    """Fill the classification prompt for one question."""
+    return TOPIC_CLASSIFICATION_PROMPT.format(
+        few_shot_examples=few_shot_text,
+        question_text=q.get("latex_text", ""),
+        main_context=q.get("main_context") or "N/A",
+        answer=q.get("answer") or "N/A",
+        section=q.get("paper_section", ""),
+    )
+
+
 def classify_question(
     client: GeminiClient,
     q: dict,
@@ -218,17 +276,12 @@ def classify_question(
 
     Returns validated tag dict or None on failure.
     """
-    prompt = TOPIC_CLASSIFICATION_PROMPT.format(
-        few_shot_examples=few_shot_text,
-        question_text=q.get("latex_text", ""),
-        main_context=q.get("main_context") or "N/A",
-        answer=q.get("answer") or "N/A",
-        section=q.get("paper_section", ""),
-    )
+    prompt = build_classification_prompt(q, few_shot_text)
 
     image = load_question_image(q)
     if image is None:
         return None
+    image = client.prepare_image(image)  # encoded once across retries
 
     max_retries = 3
     for attempt in range(max_retries):
@@ -244,19 +297,11 @@ def classify_question(
                     continue
                 return None
 
-            response_text = result.question_text.strip()
-
-            # Strip markdown code fences if present
-            if response_text.startswith("```"):
-                response_text = re.sub(r'^```(?:json)?\s*', '', response_text)
-                response_text = re.sub(r'\s*```$', '', response_text)
+            response_text = result.question_text
 
             # Extract JSON from response
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}')
-            if json_start >= 0 and json_end > json_start:
-                json_str = response_text[json_start:json_end + 1]
-                parsed = json.loads(json_str)
+            parsed = parse_first_json_object(response_text)
+            if parsed is not None:
                 return validate_tags(parsed)
 
             print(f"    [WARN] No JSON found in response")
@@ -284,6 +329,77 @@ def classify_question(
             return None
 
 
+def classify_questions(
+    client: GeminiClient,
+    questions: List[dict],
+    few_shot_text: str,
+    pool: ThreadPoolExecutor,
+    in_flight: int,
+) -> Iterator[Optional[dict]]:
+    """Classify questions in pool, yielding results in question order.
+
+    At most in_flight questions are submitted ahead of the one being
+    yielded, so the rest of the run is not queued (and its images not
+    loaded) all at once.
+    """
+    upcoming = iter(questions)
+    futures = deque(
+        pool.submit(classify_question, client, q, few_shot_text)
+        for q in islice(upcoming, in_flight)
+    )
+    while futures:
+        result = futures.popleft().result()
+        q = next(upcoming, None)
+        if q is not None:
+            futures.append(pool.submit(classify_question, client, q, few_shot_text))
+        yield result
+
+
+def classify_questions_batch(
+    client: GeminiClient,
+    questions: List[dict],
+    few_shot_text: str,
+    pool: ThreadPoolExecutor,
+) -> List[Optional[dict]]:
+    """Classify questions with one Gemini Batch API job.
+
+    For full tagging runs, where waiting for the job is fine and the batch
+    discount matters more than latency. Images are loaded in pool and
+    encoded as they arrive, so only their JPEG bytes are kept until the
+    job is submitted. There are no per-question retries; a failed
+    question comes back as None, as from classify_question, and can be
+    re-run without --force.
+
+    Returns validated tag dicts (or None), in question order.
+    """
+    images = list(pool.map(partial(load_question_image_encoded, client), questions))
+    batch_requests = {
+        str(i): ([image], build_classification_prompt(q, few_shot_text))
+        for i, (q, image) in enumerate(zip(questions, images))
+        if image is not None
+    }
+    print(f"Submitting {len(batch_requests)} questions to the Gemini Batch API...")
+    responses = client.extract_batch(batch_requests, display_name="tag-topics")
+
+    tags = []
+    for i in range(len(questions)):
+        response = responses.get(str(i))
+        if response is None:
+            tags.append(None)
+            continue
+        if not response.success:
+            print(f"    [ERROR] Gemini failed: {response.error}")
+            tags.append(None)
+            continue
+        try:
+            parsed = parse_first_json_object(response.question_text)
+        except json.JSONDecodeError as e:
+            print(f"    [WARN] JSON parse error: {e}")
+            parsed = None
+        tags.append(validate_tags(parsed) if parsed is not None else None)
+    return tags
+
+
 def validate_stored_tags(questions: List[dict]) -> dict:
     """Validate all stored tags against taxonomy. Returns stats."""
     stats = {"total": 0, "valid": 0, "invalid_topics": [],
@@ -325,6 +441,11 @@ def main():
     parser.add_argument("--limit", type=int, help="Process only N questions")
     parser.add_argument("--validate", action="store_true", help="Check existing tags against taxonomy")
     parser.add_argument("--examples", type=str, help="Path to few-shot examples JSON file")
+    parser.add_argument("--concurrency", type=int, default=TAG_WORKERS,
+                        help=f"Questions classified at once (default: {TAG_WORKERS})")
+    parser.add_argument("--batch-api", action="store_true",
+                        help="Submit all questions as one Gemini Batch API job "
+                             "(cheaper; slow to finish, for full runs)")
     args = parser.parse_args()
 
     # Validate mode — no API key needed
@@ -410,53 +531,78 @@ def main():
     failed = 0
     flagged = 0
 
-    for i, q in enumerate(questions):
-        section = q.get("paper_section", "")
-        qnum = q.get("pdf_question_num") or q.get("question_num", 0)
-        part = f"({q['part_letter']})" if q.get("part_letter") else ""
-        q_label = f"{q.get('school', '')} {section} Q{qnum}{part}"
+    # Tags are saved TAG_FLUSH_EVERY questions at a time
+    pending = []
+
+    def flush():
+        """Save the pending tags in one bulk write."""
+        nonlocal tagged, failed
+        if not pending:
+            return
+        failed_ids = update_topic_tags_bulk(pending)
+        for question_id in failed_ids:
+            print(f"    [ERROR] Failed to save tags for {question_id}")
+        failed += len(failed_ids)
+        tagged += len(pending) - len(failed_ids)
+        pending.clear()
+
+    # Images download and Gemini calls run in the pool; results are shown
+    # and saved here, in question order. If the run stops early, queued
+    # questions are cancelled and the tags gathered so far still saved.
+    workers = max(1, args.concurrency)
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        if args.batch_api:
+            results = classify_questions_batch(client, questions, few_shot_text, pool)
+        else:
+            results = classify_questions(
+                client, questions, few_shot_text, pool, in_flight=workers * 2
+            )
 
-        print(f"[{i+1}/{len(questions)}] {q_label}...", end=" ")
+        for i, (q, result) in enumerate(zip(questions, results)):
+            section = q.get("paper_section", "")
+            qnum = q.get("pdf_question_num") or q.get("question_num", 0)
+            part = f"({q['part_letter']})" if q.get("part_letter") else ""
+            q_label = f"{q.get('school', '')} {section} Q{qnum}{part}"
 
-        result = classify_question(client, q, few_shot_text)
+            print(f"[{i+1}/{len(questions)}] {q_label}...", end=" ")
 
-        if result is None:
-            print("[FAILED]")
-            failed += 1
-            continue
+            if result is None:
+                print("[FAILED]")
+                failed += 1
+                continue
 
-        confidence = result.get("confidence", 0.5)
-        needs_review = confidence < 0.7
-
-        if needs_review:
-            flagged += 1
-
-        # Display
-        review_flag = " ⚠️ REVIEW" if needs_review else ""
-        print(f"[conf={confidence:.2f}{review_flag}]")
-        print(f"    Topics:     {result['topics']}")
-        print(f"    Heuristics: {result['heuristics']}")
-
-        if not args.dry_run:
-            question_id = q.get("id")
-            if question_id:
-                ok = update_topic_tags(
-                    question_id=question_id,
-                    topics=result["topics"],
-                    heuristics=result["heuristics"],
-                    confidence=confidence,
-                    needs_review=needs_review,
-                )
-                if ok:
-                    tagged += 1
+            confidence = result.get("confidence", 0.5)
+            needs_review = confidence < 0.7
+
+            if needs_review:
+                flagged += 1
+
+            # Display
+            review_flag = " ⚠️ REVIEW" if needs_review else ""
+            print(f"[conf={confidence:.2f}{review_flag}]")
+            print(f"    Topics:     {result['topics']}")
+            print(f"    Heuristics: {result['heuristics']}")
+
+            if not args.dry_run:
+                question_id = q.get("id")
+                if question_id:
+                    pending.append((question_id, {
+                        "topics": result["topics"],
+                        "heuristics": result["heuristics"],
+                        "confidence": confidence,
+                        "needs_review": needs_review,
+                    }))
+                    if len(pending) >= TAG_FLUSH_EVERY:
+                        flush()
                 else:
-                    print(f"    [ERROR] Failed to save tags for {question_id}")
+                    print("    [WARN] No question ID, cannot save")
                     failed += 1
             else:
-                print("    [WARN] No question ID, cannot save")
-                failed += 1
-        else:
-            tagged += 1  # count as success for dry-run
+                tagged += 1  # count as success for dry-run
+    finally:
+        pool.shutdown(cancel_futures=True)
+        flush()
 
     # Summary
     print(f"\n{'=' * 60}")
@@ -2,9 +2,11 @@
 Streamlit UI for P6 Math Question Bank viewer.
 """
 
+import io
 import re
 import json
 import streamlit as st
+from PIL import Image
 from pathlib import Path
 import sys
 import os
@@ -166,18 +168,24 @@ def _get_gemini_api_key() -> str | None:
 GEMINI_API_KEY = _get_gemini_api_key()
 
 
+@st.cache_resource
+def _get_gemini_client():
+    """Shared GeminiClient for the app process.
+
+    Reusing one client keeps its HTTP connection pool (and rate-limit
+    state) alive across reruns instead of reconnecting on every click.
+    """
+    from utils.gemini_client import GeminiClient
+    return GeminiClient(api_key=GEMINI_API_KEY)
+
+
 def transcribe_screenshot(image_bytes: bytes) -> dict | str:
     """Send a screenshot to Gemini Vision and return extracted fields as a dict.
 
     Returns dict on success, or an error string on failure.
     """
-    import json as _json
-    from PIL import Image
-    import io
-    from utils.gemini_client import GeminiClient
-
     try:
-        client = GeminiClient(api_key=GEMINI_API_KEY)
+        client = _get_gemini_client()
         pil_image = Image.open(io.BytesIO(image_bytes))
         result = client.extract_from_image(pil_image, SCREENSHOT_TRANSCRIPTION_PROMPT)
         if not result.success:
@@ -194,7 +202,7 @@ def transcribe_screenshot(image_bytes: bytes) -> dict | str:
         end = raw.rfind("}") + 1
         if start == -1 or end == 0:
             return f"No JSON found in response: {raw[:200]}"
-        return _json.loads(raw[start:end])
+        return json.loads(raw[start:end])
     except Exception as e:
         return f"Transcription error: {e}"
 
@@ -205,9 +213,6 @@ def classify_question(image_bytes: bytes | None, question_text: str,
 
     Returns dict on success, or an error string on failure.
     """
-    import json as _json
-    from utils.gemini_client import GeminiClient
-
     prompt = TOPIC_CLASSIFICATION_PROMPT.format(
         few_shot_examples="(No examples provided.)",
         question_text=question_text or "",
@@ -216,18 +221,13 @@ def classify_question(image_bytes: bytes | None, question_text: str,
         section=section or "",
     )
     try:
-        client = GeminiClient(api_key=GEMINI_API_KEY)
+        client = _get_gemini_client()
         if image_bytes:
-            from PIL import Image
-            import io
             pil_image = Image.open(io.BytesIO(image_bytes))
             result = client.extract_from_image(pil_image, prompt)
         else:
             # Text-only classification (no image)
-            result = client.extract_from_image(
-                __import__('PIL.Image', fromlist=['Image']).Image.new('RGB', (1, 1)),
-                prompt,
-            )
+            result = client.extract_from_image(Image.new('RGB', (1, 1)), prompt)
         if not result.success:
             return f"Gemini API error: {result.error or 'unknown'}"
         raw = result.raw_response.strip()
@@ -240,7 +240,7 @@ def classify_question(image_bytes: bytes | None, question_text: str,
         end = raw.rfind("}") + 1
         if start == -1 or end == 0:
             return f"No JSON found in response: {raw[:200]}"
-        data = _json.loads(raw[start:end])
+        data = json.loads(raw[start:end])
         # Validate against taxonomy
         data["topics"] = [t for t in (data.get("topics") or []) if t in TOPICS]
         data["heuristics"] = [h for h in (data.get("heuristics") or []) if h in HEURISTICS]
@@ -3,7 +3,15 @@ Utility modules for P6 Math Question Extraction Pipeline.
 """
 
 from .gemini_client import GeminiClient
+from .json_extract import parse_first_json_object
+from .memory import get_memory
+from .prefetch import prefetch
+from .render import render_pages
 
 __all__ = [
     "GeminiClient",
+    "get_memory",
+    "parse_first_json_object",
+    "prefetch",
+    "render_pages",
 ]
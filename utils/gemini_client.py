@@ -5,16 +5,28 @@ Uses gemini-2.0-flash-exp (free tier) instead of local Ollama models.
 Updated to use the new google-genai SDK.
 """
 
+import io
 import os
+import re
+import json
 import time
+import base64
+import hashlib
+import tempfile
+import threading
 from pathlib import Path
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Tuple, Union
 from dataclasses import dataclass
 
 from google import genai
 from google.genai import types
 from PIL import Image
 
+try:
+    import orjson  # optional: faster cache (de)serialization
+except ImportError:
+    orjson = None
+
 
 # Default model - free tier
 DEFAULT_MODEL = "gemini-2.0-flash"
@@ -23,6 +35,30 @@ DEFAULT_MODEL = "gemini-2.0-flash"
 REQUESTS_PER_MINUTE = 15
 REQUEST_DELAY = 60 / REQUESTS_PER_MINUTE  # ~4 seconds between requests
 
+# Images are sent as JPEG: much smaller and faster to encode than PNG, which
+# the SDK otherwise uses for images opened from .png files. None = send as-is.
+JPEG_QUALITY = 85
+
+# Longest image edge sent to the model. Gemini bills large images per
+# 768px tile, so a 200 DPI A4 page (1654x2339, 12 tiles) costs twice the
+# input tokens of the same page at 2048px (6 tiles) with no loss in
+# legibility for printed exam text. Override with GEMINI_MAX_IMAGE_EDGE
+# (0 = never resize).
+MAX_IMAGE_EDGE = int(os.environ.get("GEMINI_MAX_IMAGE_EDGE", "2048"))
+
+# Batch API jobs: seconds between status checks, and the states a job ends in
+BATCH_POLL_SECONDS = 30
+BATCH_DONE_STATES = {
+    "JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED",
+}
+
+# Rows of pixel data hashed at a time for cache keys, so a full-page render
+# is never copied whole just to be hashed
+HASH_STRIP_ROWS = 256
+
+# Request key in a Batch API output line, for lines that are not valid JSON
+BATCH_KEY_RE = re.compile(r'"key"\s*:\s*"([^"]*)"')
+
 
 @dataclass
 class ExtractionResult:
@@ -38,16 +74,63 @@ class ExtractionResult:
     error: Optional[str] = None
 
 
+@dataclass
+class EncodedImage:
+    """An image already encoded for extract_batch (see GeminiClient.encode_for_batch).
+
+    Holds only the JPEG bytes and a hash of the pixels for the cache key,
+    so a large batch need not keep every decoded image until it is sent.
+    """
+    digest: str
+    jpeg: bytes
+
+
+class PreparedImage:
+    """An image whose request encoding is computed once and then reused.
+
+    Pass one to extract_from_image in place of the image when the same
+    image is sent more than once (retries, or several prompts in turn):
+    it is resized and JPEG-encoded for the first request that needs it,
+    not for every attempt. Create with GeminiClient.prepare_image, and do
+    not modify the image afterwards.
+    """
+
+    def __init__(self, client: "GeminiClient", image: Image.Image):
+        self.image = image
+        self._client = client
+        self._part = None
+
+    @property
+    def part(self):
+        """Request payload part for the image, encoded on first use."""
+        if self._part is None:
+            self._part = self._client._encode_image(self.image)
+        return self._part
+
+
 class GeminiClient:
     """Client for extracting math questions using Gemini API."""
 
-    def __init__(self, api_key: Optional[str] = None, model: str = DEFAULT_MODEL):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: str = DEFAULT_MODEL,
+        cache_dir: Optional[Path] = None,
+        jpeg_quality: Optional[int] = JPEG_QUALITY,
+        max_image_edge: Optional[int] = MAX_IMAGE_EDGE,
+    ):
         """
         Initialize Gemini client.
 
         Args:
             api_key: Gemini API key. If not provided, reads from GEMINI_API_KEY env var.
             model: Model to use (default: gemini-2.0-flash-exp)
+            cache_dir: If set, successful responses are cached on disk keyed by
+                       image content + prompt + model, so re-runs skip the API.
+            jpeg_quality: JPEG quality for uploaded images, or None to let the
+                          SDK pick the format (PNG for PNG files).
+            max_image_edge: Downscale images whose longest edge exceeds this
+                            before sending (None or 0 to send full size).
         """
         self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
         if not self.api_key:
@@ -57,44 +140,211 @@ class GeminiClient:
                 "https://aistudio.google.com/app/apikey"
             )
 
-        self.client = genai.Client(api_key=self.api_key)
+        self._client = None
+        self._client_lock = threading.Lock()
         self.model_name = model
         self.last_request_time = 0
+        self._rate_lock = threading.Lock()
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.jpeg_quality = jpeg_quality
+        self.max_image_edge = max_image_edge
+
+    @property
+    def client(self) -> genai.Client:
+        """SDK client, created on first API call so runs served entirely
+        from the response cache never build one."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = genai.Client(api_key=self.api_key)
+        return self._client
 
     def _rate_limit(self):
-        """Enforce rate limiting for free tier."""
-        elapsed = time.time() - self.last_request_time
-        if elapsed < REQUEST_DELAY:
-            sleep_time = REQUEST_DELAY - elapsed
+        """Enforce rate limiting for free tier.
+
+        Thread-safe: each caller reserves the next request slot under a lock,
+        then sleeps until it, so concurrent callers stay REQUEST_DELAY apart
+        while their requests overlap in flight.
+        """
+        with self._rate_lock:
+            now = time.time()
+            slot = max(now, self.last_request_time + REQUEST_DELAY)
+            self.last_request_time = slot
+        sleep_time = slot - now
+        if sleep_time > 0:
             print(f"  [Rate limit] Waiting {sleep_time:.1f}s...")
             time.sleep(sleep_time)
-        self.last_request_time = time.time()
+
+    def prepare_image(self, image: Image.Image) -> PreparedImage:
+        """Wrap an image that will be sent more than once (see PreparedImage)."""
+        return PreparedImage(self, image)
+
+    def encode_for_batch(self, image: Image.Image) -> EncodedImage:
+        """Encode an image for extract_batch now, so the caller can drop it."""
+        return EncodedImage(
+            digest=self._image_digest(image),
+            jpeg=self._jpeg_bytes(self._downscale(image), self._batch_quality),
+        )
+
+    @property
+    def _batch_quality(self) -> int:
+        """JPEG quality for batch requests, which are always sent as JPEG."""
+        return self.jpeg_quality or JPEG_QUALITY
+
+    def _image_part(self, image: Union[Image.Image, PreparedImage]):
+        """Request payload part for an image, reusing a prepared encoding."""
+        if isinstance(image, PreparedImage):
+            return image.part
+        return self._encode_image(image)
+
+    def _encode_image(self, image: Image.Image):
+        """Downscale and JPEG-encode an image for the request payload."""
+        image = self._downscale(image)
+        if self.jpeg_quality is None:
+            return image
+        return types.Part.from_bytes(
+            data=self._jpeg_bytes(image, self.jpeg_quality), mime_type="image/jpeg"
+        )
+
+    def _downscale(self, image: Image.Image) -> Image.Image:
+        """Shrink an image so its longest edge is at most max_image_edge."""
+        longest = max(image.size)
+        if self.max_image_edge and longest > self.max_image_edge:
+            scale = self.max_image_edge / longest
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+        return image
+
+    @staticmethod
+    def _jpeg_bytes(image: Image.Image, quality: int) -> bytes:
+        """JPEG-encode an image, flattening any transparency onto white."""
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            # JPEG has no alpha; convert("RGB") would turn transparent areas
+            # (common in UI screenshots) black, so composite onto white
+            rgba = image.convert("RGBA")
+            flat = Image.new("RGB", rgba.size, (255, 255, 255))
+            flat.paste(rgba, mask=rgba.getchannel("A"))
+            image = flat
+        elif image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _image_digest(image: Image.Image) -> str:
+        """Hash of an image's mode, size and pixels (and palette, if any)."""
+        image_hash = hashlib.sha256(f"{image.mode}:{image.size}".encode())
+        if image.mode in ("P", "PA"):
+            # Pixels are palette indices, so the same indices with another
+            # palette (or transparent index) are a different picture
+            image_hash.update(bytes(image.getpalette() or []))
+            image_hash.update(repr(image.info.get("transparency")).encode())
+        for top in range(0, image.height, HASH_STRIP_ROWS):
+            strip = image.crop((0, top, image.width, min(top + HASH_STRIP_ROWS, image.height)))
+            image_hash.update(strip.tobytes())
+        return image_hash.hexdigest()
+
+    def _cache_path(
+        self,
+        images: List[Union[Image.Image, EncodedImage]],
+        prompt: str,
+        jpeg_quality: Optional[int],
+    ) -> Path:
+        """Cache file for an (images, prompt, model) triple.
+
+        The model only sees the downscaled, re-encoded images, so the
+        resize edge and the JPEG quality they were sent with are part of
+        the key too.
+        """
+        digests = [
+            im.digest if isinstance(im, EncodedImage) else self._image_digest(im)
+            for im in images
+        ]
+        h = hashlib.sha256("\n".join(digests).encode()).hexdigest()
+        encoding = f"{self.max_image_edge or 0}:{jpeg_quality}"
+        ph = hashlib.sha256(f"{self.model_name}\n{encoding}\n{prompt}".encode()).hexdigest()
+        return self.cache_dir / h[:2] / f"{h}_{ph[:8]}.json"
+
+    @staticmethod
+    def _read_cache(cache_path: Path) -> Optional[str]:
+        """Cached response text, or None if missing or corrupt (refetch then)."""
+        if not cache_path.exists():
+            return None
+        try:
+            data = cache_path.read_bytes()
+            return (orjson.loads(data) if orjson is not None else json.loads(data))["text"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_cache(self, cache_path: Path, text: str):
+        """Write a cache entry atomically so readers never see a partial file."""
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            if orjson is not None:
+                tmp_path.write_bytes(orjson.dumps({"text": text}))
+            else:
+                tmp_path.write_text(json.dumps({"text": text}))
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)  # caching is best-effort
 
     def extract_from_image(
         self,
-        image: Image.Image,
+        image: Union[Image.Image, PreparedImage, List[Union[Image.Image, PreparedImage]]],
         prompt: str,
-        page_number: int = 0
+        page_number: int = 0,
+        stop_pattern: Optional[re.Pattern] = None,
     ) -> ExtractionResult:
         """
-        Extract content from a single image using Gemini vision.
+        Extract content from an image using Gemini vision.
 
         Args:
-            image: PIL Image object
+            image: PIL Image object (or PreparedImage), or a list of them
+                   sent together in one request (in order, after the prompt)
             prompt: Extraction prompt
             page_number: Page number for tracking
+            stop_pattern: If set, the response is streamed and cut off as soon
+                          as this pattern matches (for prompts whose useful
+                          output ends at a known marker)
 
         Returns:
             ExtractionResult with extracted content
         """
+        images = image if isinstance(image, list) else [image]
+
+        cache_path = None
+        if self.cache_dir is not None:
+            cache_path = self._cache_path(
+                [im.image if isinstance(im, PreparedImage) else im for im in images],
+                prompt,
+                self.jpeg_quality,
+            )
+            text = self._read_cache(cache_path)
+            if text is not None:
+                return ExtractionResult(
+                    question_text=text,
+                    raw_response=text,
+                    page_number=page_number,
+                    success=True
+                )
+
         self._rate_limit()
 
         try:
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=[prompt, image]
-            )
-            text = response.text
+            contents = [prompt] + [self._image_part(im) for im in images]
+            if stop_pattern is None:
+                response = self.client.models.generate_content(
+                    model=self.model_name,
+                    contents=contents
+                )
+                text = response.text
+            else:
+                text = self._generate_until(contents, stop_pattern)
+
+            if cache_path is not None and text:
+                self._write_cache(cache_path, text)
 
             return ExtractionResult(
                 question_text=text,
@@ -111,6 +361,142 @@ class GeminiClient:
                 error=str(e)
             )
 
+    def extract_batch(
+        self,
+        requests: Dict[str, Tuple[List[Union[Image.Image, EncodedImage]], str]],
+        display_name: str = "p6-math-batch",
+        poll_seconds: int = BATCH_POLL_SECONDS,
+    ) -> Dict[str, ExtractionResult]:
+        """
+        Run many requests as one Gemini Batch API job.
+
+        For large non-interactive runs: batch jobs are billed at a discount
+        and do not count against the per-minute limit that _rate_limit
+        paces, but take minutes to hours to finish. Responses already in
+        the cache are returned without being submitted. This blocks,
+        polling every poll_seconds, until the job ends.
+
+        Args:
+            requests: Key -> (images, prompt), sent as extract_from_image
+                      would send them. Images may be pre-encoded with
+                      encode_for_batch.
+            display_name: Name shown for the job and its input file
+            poll_seconds: Seconds between job status checks
+
+        Returns:
+            Key -> ExtractionResult for every key in requests (failed ones
+            have success=False)
+        """
+        results = {}
+        pending = {}
+        for key, (images, prompt) in requests.items():
+            cache_path = (
+                self._cache_path(images, prompt, self._batch_quality)
+                if self.cache_dir is not None else None
+            )
+            text = self._read_cache(cache_path) if cache_path is not None else None
+            if text is not None:
+                results[key] = ExtractionResult(question_text=text, raw_response=text)
+            else:
+                pending[key] = (cache_path, images, prompt)
+
+        if not pending:
+            return results
+
+        def failure(error: str) -> ExtractionResult:
+            return ExtractionResult(question_text="", success=False, error=error)
+
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                input_path = Path(tmp_dir) / f"{display_name}.jsonl"
+                with open(input_path, "w") as f:
+                    for key, (_, images, prompt) in pending.items():
+                        parts = [{"text": prompt}] + [
+                            {"inline_data": {
+                                "mime_type": "image/jpeg",
+                                "data": base64.b64encode(
+                                    im.jpeg if isinstance(im, EncodedImage)
+                                    else self._jpeg_bytes(self._downscale(im), self._batch_quality)
+                                ).decode("ascii"),
+                            }}
+                            for im in images
+                        ]
+                        f.write(json.dumps({
+                            "key": key,
+                            "request": {"contents": [{"role": "user", "parts": parts}]},
+                        }) + "\n")
+                uploaded = self.client.files.upload(
+                    file=str(input_path),
+                    config=types.UploadFileConfig(display_name=display_name, mime_type="jsonl"),
+                )
+
+            job = self.client.batches.create(
+                model=self.model_name,
+                src=uploaded.name,
+                config={"display_name": display_name},
+            )
+            print(f"  [Batch] Submitted {len(pending)} requests as {job.name}")
+            while job.state.name not in BATCH_DONE_STATES:
+                time.sleep(poll_seconds)
+                job = self.client.batches.get(name=job.name)
+                print(f"  [Batch] {job.state.name}")
+
+            if job.state.name != "JOB_STATE_SUCCEEDED":
+                raise RuntimeError(f"Batch job ended in {job.state.name}")
+            output = self.client.files.download(file=job.dest.file_name)
+        except Exception as e:
+            for key in pending:
+                results[key] = failure(str(e))
+            return results
+
+        for line in output.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                # Fail only the request this line belongs to, if it can be told
+                match = BATCH_KEY_RE.search(line)
+                if match and match.group(1) in pending:
+                    results[match.group(1)] = failure(f"Unreadable batch response: {e}")
+                continue
+            key = item.get("key")
+            if key not in pending:
+                continue
+            if "error" in item:
+                results[key] = failure(str(item["error"]))
+                continue
+            candidates = item.get("response", {}).get("candidates") or [{}]
+            parts = candidates[0].get("content", {}).get("parts", [])
+            text = "".join(p.get("text", "") for p in parts)
+            if not text:
+                results[key] = failure("Empty batch response")
+                continue
+            cache_path = pending[key][0]
+            if cache_path is not None:
+                self._write_cache(cache_path, text)
+            results[key] = ExtractionResult(question_text=text, raw_response=text)
+
+        for key in pending:
+            results.setdefault(key, failure("No response in batch output"))
+        return results
+
+    def _generate_until(self, contents: list, stop_pattern: re.Pattern) -> str:
+        """Stream a response, stopping once stop_pattern matches the text so far."""
+        chunks = []
+        stream = self.client.models.generate_content_stream(
+            model=self.model_name,
+            contents=contents
+        )
+        try:
+            for chunk in stream:
+                chunks.append(chunk.text or "")
+                if stop_pattern.search("".join(chunks)):
+                    break
+        finally:
+            stream.close()
+        return "".join(chunks)
+
     def extract_questions_from_pdf_page(
         self,
         image: Image.Image,
@@ -161,13 +547,17 @@ class GeminiClient:
             return GENERAL_EXTRACTION_PROMPT
 
     def test_connection(self) -> bool:
-        """Test if API connection works."""
+        """
+        Test if API connection works.
+
+        Fetches the model's metadata rather than generating text: it checks
+        the key and model name without using generation quota or a rate-limit
+        slot, and leaves a warm (TLS-established) connection in the client's
+        pool for the first real request.
+        """
         try:
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents="Reply with just 'OK' if you can read this."
-            )
-            return "OK" in response.text.upper()
+            self.client.models.get(model=self.model_name)
+            return True
         except Exception as e:
             print(f"Connection test failed: {e}")
             return False
@@ -0,0 +1,48 @@
+"""
+Pull a JSON object out of a model response.
+
+Responses often wrap the JSON in prose or markdown fences. Decoding from
+the first "{" with raw_decode stops at the end of that object, so there is
+no regex scan for the last "}" and trailing text (even text containing
+braces) does not break the parse.
+
+When orjson is installed, the span from the first "{" to the last "}" is
+tried with it first. That span only parses if it is exactly the first
+object (plus whitespace), so the result is the same as raw_decode's; when
+there is trailing text with braces, it falls back to raw_decode.
+"""
+
+import json
+from typing import Any, Optional
+
+try:
+    import orjson  # optional: faster parsing of the common case
+except ImportError:
+    orjson = None
+
+_decoder = json.JSONDecoder()
+
+
+def parse_first_json_object(text: str) -> Optional[Any]:
+    """
+    Decode the JSON value starting at the first "{" in text.
+
+    Args:
+        text: Response text
+
+    Returns:
+        The decoded object, or None if text contains no "{"
+
+    Raises:
+        json.JSONDecodeError: If the text from the first "{" is not valid JSON
+    """
+    start = text.find("{")
+    if start < 0:
+        return None
+    if orjson is not None:
+        try:
+            return orjson.loads(text[start:text.rfind("}") + 1])
+        except orjson.JSONDecodeError:
+            pass
+    obj, _ = _decoder.raw_decode(text, start)
+    return obj
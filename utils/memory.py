@@ -0,0 +1,23 @@
+"""
+Process memory reporting for the pipeline progress logs.
+"""
+
+import sys
+
+try:
+    import resource  # POSIX: peak RSS from one getrusage() syscall
+except ImportError:  # Windows
+    resource = None
+    import psutil
+
+
+def get_memory() -> str:
+    """Peak resident memory (RSS) of this process, e.g. "412.3 MB peak"."""
+    if resource is None:
+        # Windows reports the peak working set, its equivalent of peak RSS
+        peak = psutil.Process().memory_info().peak_wset
+        return f"{peak / 1024 / 1024:.1f} MB peak"
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return f"{peak / divisor:.1f} MB peak"
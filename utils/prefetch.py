@@ -0,0 +1,54 @@
+"""
+Background prefetching for the page render → Gemini call loops.
+
+Rendering a PDF page is CPU work, while the Gemini call that follows it is
+seconds of network wait. Rendering the next page during that wait overlaps
+the two stages.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def prefetch(
+    func: Callable[[T], R], items: Iterable[T], depth: int = 1
+) -> Iterator[Tuple[T, R]]:
+    """
+    Yield (item, func(item)) in order, computing up to depth results ahead.
+
+    A single worker thread runs every call to func, so calls never overlap
+    each other. This keeps it safe for objects such as an open pdfplumber
+    document, as long as the caller does not touch them while iterating.
+
+    A depth above 1 lets the worker run further ahead during slow consumer
+    steps, so a run of fast steps afterwards (cache hits, skipped pages)
+    does not stall on it. Each queued result is held in memory.
+
+    Args:
+        func: Function to run on each item (e.g. render a page number)
+        items: Items to process, in order
+        depth: Maximum number of results computed ahead of the consumer
+
+    Returns:
+        Iterator of (item, result) tuples
+    """
+    items = list(items)
+    if not items:
+        return
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pending = deque(
+            (item, pool.submit(func, item)) for item in items[:depth]
+        )
+        next_index = len(pending)
+        while pending:
+            item, future = pending.popleft()
+            result = future.result()
+            if next_index < len(items):
+                pending.append((items[next_index], pool.submit(func, items[next_index])))
+                next_index += 1
+            yield item, result
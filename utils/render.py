@@ -0,0 +1,111 @@
+"""
+Parallel PDF page rendering.
+
+Rasterizing a page is CPU-bound and pdfplumber releases little of it to
+other threads, so pages are rendered in separate processes. Each worker
+opens its own copy of the PDF; open documents cannot be shared across
+processes. A pool initializer opens each worker's copy once, and the
+worker keeps it for every page it renders rather than re-parsing the
+file per page; it is released when the pool shuts its workers down.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple
+
+import pdfplumber
+from PIL import Image
+
+
+# The document a pool worker renders from, opened by _init_worker
+_worker_pdf: Optional[pdfplumber.PDF] = None
+
+
+def _init_worker(pdf_path: str):
+    """Pool initializer: open the PDF once for this worker's pages."""
+    global _worker_pdf
+    _worker_pdf = pdfplumber.open(pdf_path)
+
+
+def _render_worker_page(
+    page_num: int, dpi: int, save_dir: Optional[Path], save_prefix: str
+) -> Optional[Image.Image]:
+    """_render_page on the worker's open document (see _init_worker)."""
+    return _render_page(_worker_pdf, page_num, dpi, save_dir, save_prefix)
+
+
+def _render_page(
+    pdf: pdfplumber.PDF,
+    page_num: int,
+    dpi: int,
+    save_dir: Optional[Path] = None,
+    save_prefix: str = "",
+) -> Optional[Image.Image]:
+    """Render one 1-indexed page (saving it if asked), or None if out of range."""
+    if page_num < 1 or page_num > len(pdf.pages):
+        return None
+    page = pdf.pages[page_num - 1]
+    image = page.to_image(resolution=dpi).original
+    page.close()  # the document stays open, so drop the page's object cache
+    if save_dir is not None:
+        image.save(Path(save_dir) / f"{save_prefix}{page_num:02d}.png")
+    return image
+
+
+def render_pages(
+    pdf_path: Path,
+    page_nums: Iterable[int],
+    dpi: int,
+    workers: Optional[int] = None,
+    save_dir: Optional[Path] = None,
+    save_prefix: str = "",
+) -> Iterator[Tuple[int, Image.Image]]:
+    """
+    Render PDF pages concurrently in a process pool.
+
+    Pages are yielded as soon as they are ready (in order), so callers can
+    start on the first page while later ones render, and need not hold
+    every page in memory at once.
+
+    Args:
+        pdf_path: Path to the PDF file
+        page_nums: 1-indexed page numbers to render
+        dpi: Render resolution
+        workers: Number of processes (default: half the CPU count)
+        save_dir: If given, each page is also saved by its worker to
+                  save_dir / f"{save_prefix}{page_num:02d}.png"
+        save_prefix: File name prefix for saved pages
+
+    Returns:
+        Iterator of (page_num, image) in the order given, skipping invalid pages
+    """
+    page_nums = list(page_nums)
+    if not page_nums:
+        return
+
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 2) // 2)
+    workers = min(workers, len(page_nums))
+
+    if workers == 1:
+        with pdfplumber.open(pdf_path) as pdf:
+            for n in page_nums:
+                image = _render_page(pdf, n, dpi, save_dir, save_prefix)
+                if image is not None:
+                    yield n, image
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(str(pdf_path),)
+    ) as pool:
+        images = pool.map(
+            _render_worker_page,
+            page_nums,
+            [dpi] * len(page_nums),
+            [save_dir] * len(page_nums),
+            [save_prefix] * len(page_nums),
+        )
+        for n, image in zip(page_nums, images):
+            if image is not None:
+                yield n, image
@@ -44,6 +44,10 @@ SUSPICIOUS_PATTERNS = [
     r"there is no",
 ]
 
+# One alternation scans each answer once instead of once per pattern
+SUSPICIOUS_RE = re.compile("|".join(f"(?:{p})" for p in SUSPICIOUS_PATTERNS), re.IGNORECASE)
+BLANK_PAGE_RE = re.compile(r"blank\s*page", re.IGNORECASE)
+
 
 @dataclass
 class ValidationIssue:
@@ -158,22 +162,20 @@ def check_suspicious_answers(questions: List[dict]) -> List[ValidationIssue]:
         text = q.get('latex_text', '') or ''
 
         # Check answer
-        for pattern in SUSPICIOUS_PATTERNS:
-            if re.search(pattern, answer, re.IGNORECASE):
-                issues.append(ValidationIssue(
-                    school=q['school'],
-                    section=q['paper_section'],
-                    question_num=q['question_num'],
-                    part_letter=q.get('part_letter'),
-                    issue_type="suspicious_answer",
-                    description=f"Suspicious answer: '{answer[:80]}...'",
-                    severity="error",
-                    question_id=q['id']
-                ))
-                break
+        if SUSPICIOUS_RE.search(answer):
+            issues.append(ValidationIssue(
+                school=q['school'],
+                section=q['paper_section'],
+                question_num=q['question_num'],
+                part_letter=q.get('part_letter'),
+                issue_type="suspicious_answer",
+                description=f"Suspicious answer: '{answer[:80]}...'",
+                severity="error",
+                question_id=q['id']
+            ))
 
         # Check if question text mentions "BLANK PAGE"
-        if re.search(r"blank\s*page", text, re.IGNORECASE):
+        if BLANK_PAGE_RE.search(text):
             issues.append(ValidationIssue(
                 school=q['school'],
                 section=q['paper_section'],
@@ -188,19 +190,17 @@ def check_suspicious_answers(questions: List[dict]) -> List[ValidationIssue]:
     return issues
 
 
-def check_section_counts(questions: List[dict], school: str) -> List[ValidationIssue]:
-    """Check if each section has reasonable question count."""
-    issues = []
+def check_section_counts(by_section: Dict[str, List[dict]], school: str) -> List[ValidationIssue]:
+    """Check if each section has reasonable question count.
 
-    by_section = {}
-    for q in questions:
-        sec = q['paper_section']
-        if sec not in by_section:
-            by_section[sec] = set()
-        by_section[sec].add(q['question_num'])
+    Args:
+        by_section: The school's questions grouped by paper_section
+        school: School name for reported issues
+    """
+    issues = []
 
     for section, expected in EXPECTED_COUNTS.items():
-        actual = len(by_section.get(section, set()))
+        actual = len({q['question_num'] for q in by_section.get(section, ())})
         if actual == 0:
             issues.append(ValidationIssue(
                 school=school,
@@ -255,7 +255,7 @@ def validate_school(school: str) -> List[ValidationIssue]:
 
     all_issues.extend(check_multipart_duplicates(questions))
     all_issues.extend(check_suspicious_answers(questions))
-    all_issues.extend(check_section_counts(questions, school))
+    all_issues.extend(check_section_counts(by_section, school))
 
     return all_issues
 
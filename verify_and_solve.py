@@ -29,20 +29,20 @@ import sys
 import gc
 import argparse
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Dict, List, Tuple
+from typing import Optional, Dict, List, Tuple, Union
 from dataclasses import dataclass
 
-import pdfplumber
 from PIL import Image
-import cv2
 import numpy as np
 
 sys.path.insert(0, str(Path(__file__).parent))
 
-from segmenter import QuestionSegmenter
+from segmenter import QuestionSegmenter, QuestionBox
 
-from utils.gemini_client import GeminiClient
+from utils.gemini_client import GeminiClient, PreparedImage
+from utils.render import render_pages
 from database import get_questions, get_connection, get_question, update_answer
 from config import PDF_DIR, IMAGES_DIR
 
@@ -53,6 +53,33 @@ import json
 
 DPI = 200
 
+# Pre-compiled patterns for answer key and Gemini response parsing
+MCQ_DIGIT_RE = re.compile(r'(?:Option\s*)?[(\[]?([1-4])[)\]]?', re.IGNORECASE)
+WHITESPACE_RE = re.compile(r'\s+')
+FLAT_JSON_RE = re.compile(r'\{[^{}]*\}', re.DOTALL)
+SECTION_KEY_RE = re.compile(r'(P1A|P1B|P2)_(\d+[a-z]?)', re.IGNORECASE)
+SORT_KEY_RE = re.compile(r'(P1A|P1B|P2)_(\d+)')
+Q_LINE_RE = re.compile(r'^Q(\d+)\s*(?:\(([a-e])\)|([a-e]))?\s*[:\s]+(.*)$', re.IGNORECASE)
+PART_LINE_RE = re.compile(r'^\(([a-e])\)\s*(.+)$', re.IGNORECASE)
+MY_ANSWER_RE = re.compile(r'MY_ANSWER:\s*(.+?)(?=\n|CANDIDATE:|$)', re.IGNORECASE)
+MY_SOLUTION_RE = re.compile(r'MY_SOLUTION:\s*(.+?)(?=MY_ANSWER:|$)', re.DOTALL | re.IGNORECASE)
+VERDICT_RE = re.compile(r'VERDICT:\s*(MATCH|MISMATCH)', re.IGNORECASE)
+# Verify responses are streamed and cut off once the verdict line is complete;
+# the explanation the prompt allows after it is never parsed
+VERDICT_DONE_RE = re.compile(r'VERDICT:\s*(?:MATCH|MISMATCH)\s*\n', re.IGNORECASE)
+ANSWER_LINE_RE = re.compile(r'ANSWER:\s*(.+?)(?=\n|$)', re.IGNORECASE)
+ANSWER_BLOCK_RE = re.compile(r'ANSWER:\s*(.+?)(?=\n\n|\Z)', re.IGNORECASE | re.DOTALL)
+MULTI_PART_ANSWER_RE = re.compile(r'ANSWER:\s*\n?((?:\([a-e]\)\s*.+\n?)+)', re.IGNORECASE | re.MULTILINE)
+WORKING_RE = re.compile(r'WORKING:\s*(.+?)(?=\nANSWER:|\Z)', re.DOTALL | re.IGNORECASE)
+
+# Answer key pages are independent, so their Gemini calls run concurrently
+# (GeminiClient still spaces request starts to stay within the rate limit)
+ANSWER_KEY_WORKERS = 4
+
+# Shared by every page segmented in this run (pages are segmented on the
+# main thread), so its kernel and any CUDA state are set up once
+SEGMENTER = QuestionSegmenter()
+
 
 def normalize_mcq(answer: str) -> str:
     """
@@ -66,7 +93,7 @@ def normalize_mcq(answer: str) -> str:
         return answer.upper()
 
     # Extract digit from various formats
-    match = re.search(r'(?:Option\s*)?[(\[]?([1-4])[)\]]?', answer, re.IGNORECASE)
+    match = MCQ_DIGIT_RE.search(answer)
     if match:
         digit = match.group(1)
         return {'1': 'A', '2': 'B', '3': 'C', '4': 'D'}[digit]
@@ -90,7 +117,7 @@ def normalize_answer(answer: str) -> str:
 
     # Remove common variations that shouldn't affect comparison
     # e.g., "$" at start, "cm" units, extra spaces
-    normalized = re.sub(r'\s+', ' ', answer)
+    normalized = WHITESPACE_RE.sub(' ', answer)
 
     # For numeric answers, try to extract the numeric value
     # But keep units for comparison
@@ -427,7 +454,7 @@ def extract_answers_from_page(
 
         # Approach 3: Extract with simple regex (fallback)
         if not answers_dict:
-            json_match = re.search(r'\{[^{}]*\}', response_text, re.DOTALL)
+            json_match = FLAT_JSON_RE.search(response_text)
             if json_match:
                 answers_dict = json.loads(json_match.group())
 
@@ -442,7 +469,7 @@ def extract_answers_from_page(
     answers = []
     for key, answer in answers_dict.items():
         # Parse section-prefixed key like "P1A_1", "P1B_16a", "P2_1"
-        section_match = re.match(r'(P1A|P1B|P2)_(\d+[a-z]?)', key, re.IGNORECASE)
+        section_match = SECTION_KEY_RE.match(key)
 
         if section_match:
             section = section_match.group(1).upper()
@@ -452,12 +479,14 @@ def extract_answers_from_page(
             section = None
             q_num_str = key
 
-        # Extract base question number
-        base_match = re.match(r'(\d+)', q_num_str)
-        if not base_match:
+        # Extract base question number (leading digits, e.g. "16a" -> 16)
+        end = 0
+        while end < len(q_num_str) and q_num_str[end].isdecimal():
+            end += 1
+        if not end:
             continue
 
-        q_num = int(base_match.group(1))
+        q_num = int(q_num_str[:end])
 
         # Normalize MCQ (1→A, 2→B, etc.) only for P1A
         normalized = str(answer)
@@ -503,7 +532,7 @@ def _fallback_line_parsing(response_text: str, page_num: int) -> List[Tuple[str,
             continue
 
         # Check for Q# pattern with optional part letter: Q21, Q21(a), Q21a
-        q_match = re.match(r'^Q(\d+)\s*(?:\(([a-e])\)|([a-e]))?\s*[:\s]+(.*)$', line, re.IGNORECASE)
+        q_match = Q_LINE_RE.match(line)
         if q_match:
             # Save previous
             if current_q and current_answer:
@@ -527,7 +556,7 @@ def _fallback_line_parsing(response_text: str, page_num: int) -> List[Tuple[str,
 
         # Check for standalone part pattern: (a) answer, (b) answer
         elif current_q:
-            part_match = re.match(r'^\(([a-e])\)\s*(.+)$', line, re.IGNORECASE)
+            part_match = PART_LINE_RE.match(line)
             if part_match:
                 # Save previous part if exists
                 if current_answer:
@@ -576,10 +605,27 @@ def _infer_section(q_num: int) -> Optional[str]:
     return None
 
 
+def segment_page_image(page_image: Image.Image) -> List[QuestionBox]:
+    """
+    Detect question boxes on a full-page image.
+
+    Args:
+        page_image: Full page PIL Image
+
+    Returns:
+        List of QuestionBox regions found on the page
+    """
+    # Line detection only needs grayscale, so convert once in PIL (same
+    # luma weights as cv2) instead of RGB->BGR here and BGR->GRAY later
+    gray = np.asarray(page_image.convert("L"))
+    return SEGMENTER.segment_page(gray)
+
+
 def crop_question_from_page(
     page_image: Image.Image,
     pdf_qnum: int,
-    section: str
+    section: str,
+    boxes: Optional[List[QuestionBox]] = None,
 ) -> Image.Image:
     """
     Crop the specific question region from a full-page image.
@@ -589,16 +635,13 @@ def crop_question_from_page(
         page_image: Full page PIL Image
         pdf_qnum: The question number as shown in the PDF
         section: Paper section (P1A, P1B, P2)
+        boxes: Question boxes already detected on this page, if known
 
     Returns:
         Cropped PIL Image of just the question region
     """
-    # Convert PIL to OpenCV format
-    cv_image = cv2.cvtColor(np.array(page_image), cv2.COLOR_RGB2BGR)
-
-    # Use segmenter to detect question boxes
-    segmenter = QuestionSegmenter()
-    boxes = segmenter.segment_page(cv_image)
+    if boxes is None:
+        boxes = segment_page_image(page_image)
 
     if not boxes:
         # Fallback: return full image if no boxes detected
@@ -609,8 +652,6 @@ def crop_question_from_page(
     # Use position on page to select the right box
     # First question on page is usually at the top
 
-    height = cv_image.shape[0]
-
     # Estimate which box contains our question
     # P2 questions are numbered 1-17, typically 1-2 per page
     # If pdf_qnum is odd, likely first on page; if even, likely second
@@ -626,10 +667,10 @@ def crop_question_from_page(
     else:
         return page_image
 
-    # Crop and convert back to PIL
-    cropped = cv_image[best_box.y_start:best_box.y_end, best_box.x_start:best_box.x_end]
+    # Crop the original PIL image directly (no BGR round trip)
+    cropped = page_image.crop((best_box.x_start, best_box.y_start, best_box.x_end, best_box.y_end))
     print(f"[CROP: {best_box.height}px] ", end="")
-    return Image.fromarray(cv2.cvtColor(cropped, cv2.COLOR_BGR2RGB))
+    return cropped
 
 
 def verify_answer(
@@ -648,7 +689,7 @@ def verify_answer(
     - working: Working steps (if provided)
     """
     prompt = VERIFY_ANSWER_PROMPT.format(answer=candidate_answer)
-    result = client.extract_from_image(question_image, prompt)
+    result = client.extract_from_image(question_image, prompt, stop_pattern=VERDICT_DONE_RE)
 
     if not result.success:
         return "UNSURE", None, None
@@ -656,15 +697,15 @@ def verify_answer(
     response = result.question_text
 
     # Extract AI's own answer
-    my_answer_match = re.search(r'MY_ANSWER:\s*(.+?)(?=\n|CANDIDATE:|$)', response, re.IGNORECASE)
+    my_answer_match = MY_ANSWER_RE.search(response)
     my_answer = my_answer_match.group(1).strip() if my_answer_match else None
 
     # Extract working
-    working_match = re.search(r'MY_SOLUTION:\s*(.+?)(?=MY_ANSWER:|$)', response, re.DOTALL | re.IGNORECASE)
+    working_match = MY_SOLUTION_RE.search(response)
     working = working_match.group(1).strip() if working_match else None
 
     # Check verdict
-    verdict_match = re.search(r'VERDICT:\s*(MATCH|MISMATCH)', response, re.IGNORECASE)
+    verdict_match = VERDICT_RE.search(response)
 
     if verdict_match:
         verdict = verdict_match.group(1).upper()
@@ -708,7 +749,7 @@ def verify_answer_with_context(
         question_text=question_text,
         answer=candidate_answer
     )
-    result = client.extract_from_image(question_image, prompt)
+    result = client.extract_from_image(question_image, prompt, stop_pattern=VERDICT_DONE_RE)
 
     if not result.success:
         return "UNSURE", None, None
@@ -716,15 +757,15 @@ def verify_answer_with_context(
     response = result.question_text
 
     # Extract AI's own answer
-    my_answer_match = re.search(r'MY_ANSWER:\s*(.+?)(?=\n|CANDIDATE:|$)', response, re.IGNORECASE)
+    my_answer_match = MY_ANSWER_RE.search(response)
     my_answer = my_answer_match.group(1).strip() if my_answer_match else None
 
     # Extract working
-    working_match = re.search(r'MY_SOLUTION:\s*(.+?)(?=MY_ANSWER:|$)', response, re.DOTALL | re.IGNORECASE)
+    working_match = MY_SOLUTION_RE.search(response)
     working = working_match.group(1).strip() if working_match else None
 
     # Check verdict
-    verdict_match = re.search(r'VERDICT:\s*(MATCH|MISMATCH)', response, re.IGNORECASE)
+    verdict_match = VERDICT_RE.search(response)
 
     if verdict_match:
         verdict = verdict_match.group(1).upper()
@@ -761,13 +802,13 @@ def solve_question(
 
     # Parse answer
     answer = None
-    ans_match = re.search(r'ANSWER:\s*(.+?)(?=\n|$)', response, re.IGNORECASE)
+    ans_match = ANSWER_LINE_RE.search(response)
     if ans_match:
         answer = ans_match.group(1).strip()
 
     # Parse working
     working = None
-    working_match = re.search(r'WORKING:\s*(.+?)(?=\nANSWER:|\Z)', response, re.DOTALL | re.IGNORECASE)
+    working_match = WORKING_RE.search(response)
     if working_match:
         working = working_match.group(1).strip()
 
@@ -776,7 +817,7 @@ def solve_question(
 
 def solve_question_p2(
     client: GeminiClient,
-    question_image: Image.Image,
+    question_image: Union[Image.Image, PreparedImage],
     pdf_qnum: int
 ) -> Tuple[Optional[str], Optional[str]]:
     """
@@ -798,21 +839,18 @@ def solve_question_p2(
     answer = None
 
     # Try multi-part format first: look for lines with (a), (b), etc.
-    multi_part_match = re.search(
-        r'ANSWER:\s*\n?((?:\([a-e]\)\s*.+\n?)+)',
-        response, re.IGNORECASE | re.MULTILINE
-    )
+    multi_part_match = MULTI_PART_ANSWER_RE.search(response)
     if multi_part_match:
         answer = multi_part_match.group(1).strip()
     else:
         # Try single answer format
-        ans_match = re.search(r'ANSWER:\s*(.+?)(?=\n\n|\Z)', response, re.IGNORECASE | re.DOTALL)
+        ans_match = ANSWER_BLOCK_RE.search(response)
         if ans_match:
             answer = ans_match.group(1).strip()
 
     # Parse working
     working = None
-    working_match = re.search(r'WORKING:\s*(.+?)(?=\nANSWER:|\Z)', response, re.DOTALL | re.IGNORECASE)
+    working_match = WORKING_RE.search(response)
     if working_match:
         working = working_match.group(1).strip()
 
@@ -821,7 +859,7 @@ def solve_question_p2(
 
 def solve_question_lenient(
     client: GeminiClient,
-    question_image: Image.Image
+    question_image: Union[Image.Image, PreparedImage]
 ) -> Tuple[Optional[str], Optional[str]]:
     """
     Last-resort lenient solving - just get the answer.
@@ -867,6 +905,8 @@ def process_p2_with_retry(
         return candidate.answer, None, "[answer-key]"
 
     # Step 2: No candidate - solve directly with P2 prompt + retry
+    # (every attempt and the fallback send the same image; encode it once)
+    question_image = client.prepare_image(question_image)
     for attempt in range(max_retries):
         answer, working = solve_question_p2(client, question_image, pdf_qnum)
         if answer:
@@ -900,6 +940,10 @@ def process_questions(
         "failed": 0
     }
 
+    # Several questions (and every part of a multi-part question) share one
+    # page image, so segment each page once and reuse its boxes
+    page_boxes: Dict[Path, List[QuestionBox]] = {}
+
     for i, q in enumerate(questions):
         section = q['paper_section']
         qnum = q['question_num']
@@ -955,7 +999,11 @@ def process_questions(
         else:
             # No candidate answer, solve directly with retry
             if section == 'P2':
-                cropped_image = crop_question_from_page(question_image, pdf_qnum, section)
+                if image_path not in page_boxes:
+                    page_boxes[image_path] = segment_page_image(question_image)
+                cropped_image = crop_question_from_page(
+                    question_image, pdf_qnum, section, boxes=page_boxes[image_path]
+                )
                 print("[NO CANDIDATE] Solving with retry... ", end="")
                 final_answer, final_working, final_tag = process_p2_with_retry(
                     client, cropped_image, pdf_qnum, None
@@ -994,7 +1042,6 @@ def process_questions(
 
         # Cleanup and rate limit
         del question_image
-        gc.collect()
         time.sleep(0.5)
 
     return stats
@@ -1046,38 +1093,38 @@ def main():
             start, end = map(int, args.answer_pages.split("-"))
             pages = list(range(start, end + 1))
 
-            with pdfplumber.open(pdf_path) as pdf:
-                for page_num in pages:
-                    if page_num < 1 or page_num > len(pdf.pages):
-                        continue
+            with ThreadPoolExecutor(max_workers=ANSWER_KEY_WORKERS) as executor:
+                # Answer key page images are saved for reference by the
+                # render workers, keeping PNG encoding off this process
+                save_prefix = f"{school_name}_{pdf_year}_answer_p"
 
-                    print(f"  Page {page_num}... ", end="")
-                    page = pdf.pages[page_num - 1]
-                    img = page.to_image(resolution=DPI)
-                    image = img.original
+                # Each page goes to Gemini as soon as it is rendered; only the
+                # futures are kept, so finished pages can be freed
+                futures = []
+                for page_num, image in render_pages(
+                    pdf_path, pages, DPI, save_dir=ANSWER_KEY_DIR, save_prefix=save_prefix
+                ):
+                    futures.append((page_num, executor.submit(extract_answers_from_page, client, image, page_num)))
 
-                    # Save answer key page image for reference
-                    answer_img_path = ANSWER_KEY_DIR / f"{school_name}_{pdf_year}_answer_p{page_num:02d}.png"
-                    image.save(answer_img_path)
-                    print(f"[saved] ", end="")
+                print(f"  Rendered {len(futures)} pages [saved]")
 
-                    answers = extract_answers_from_page(client, image, page_num)
-                    print(f"found {len(answers)} answers")
+                # Merge in page order so later pages still win on duplicate keys
+                for page_num, future in futures:
+                    answers = future.result()
+                    print(f"  Page {page_num}... found {len(answers)} answers")
 
                     for key, ans in answers:
                         # Store by section-prefixed key (e.g., "P1A_1", "P1B_16", "P2_1")
                         candidate_answers[key] = ans
 
-                    del image
-                    gc.collect()
-                    time.sleep(1)
+            gc.collect()
 
             print(f"  Total candidate answers: {len(candidate_answers)}")
             # Show extracted answers for debugging
             if candidate_answers:
                 # Sort keys by section then number
                 def sort_key(k):
-                    m = re.match(r'(P1A|P1B|P2)_(\d+)', k)
+                    m = SORT_KEY_RE.match(k)
                     if m:
                         section_order = {'P1A': 0, 'P1B': 1, 'P2': 2}
                         return (section_order.get(m.group(1), 3), int(m.group(2)))